@@ -6,16 +6,35 @@ interface Params {
   params: { productId: string };
 }
 
+export async function GET(
+  _req: Request,
+  { params }: { params: Promise<{ productId: string }> }
+) {
+  const { productId } = await params;
+  const cookieStore = await cookies();
+  const token = cookieStore.get("access_token")?.value || "";
+
+  const response = await apiFetch(`/api/products/${productId}`, {
+    method: "GET",
+    headers: { Authorization: `Bearer ${token}` },
+  });
+
+  const data = await response.json();
+  return NextResponse.json(data, { status: response.status });
+}
+
 export async function PUT(
   req: Request,
   { params }: { params: Promise<{ productId: string }> }
 ) {
   const { productId: id } = await params;  // 👈 await it
   const body = await req.json();
+  const cookieStore = await cookies();
+  const token = cookieStore.get("access_token")?.value || "";
 
   const response = await apiFetch(`/api/products/${id}`, {
     method: "PUT",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", Authorization: `Bearer ${token}` },
     body: JSON.stringify(body),
   });
 
@@ -28,9 +47,12 @@ export async function DELETE(
   { params }: { params: Promise<{ productId: string }> }
 ) {
   const { productId } = await params;
+  const cookieStore = await cookies();
+  const token = cookieStore.get("access_token")?.value || "";
 
   const response = await apiFetch(`/api/products/${productId}`, {
     method: "DELETE",
+    headers: { Authorization: `Bearer ${token}` },
   });
 
   //Error in HTML
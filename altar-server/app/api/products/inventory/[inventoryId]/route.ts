@@ -0,0 +1,21 @@
+import { NextResponse } from "next/server";
+import { apiFetch } from "@/lib/api";
+import { cookies } from "next/headers";
+
+export async function GET(
+  _req: Request,
+  context: { params: Promise<{ inventoryId: string }> }
+) {
+  const { inventoryId } = await context.params;
+
+  const cookieStore = await cookies();
+  const token = cookieStore.get("access_token")?.value || "";
+
+  const res = await apiFetch(`/api/products/inventory/${inventoryId}`, {
+    method: "GET",
+    headers: { Authorization: `Bearer ${token}` },
+  });
+
+  const data = await res.json();
+  return NextResponse.json(data, { status: res.status });
+}
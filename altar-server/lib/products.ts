@@ -1,10 +1,10 @@
 // lib/products.ts
-import { apiFetch } from "./api";
+// Calls go through the Next.js API routes, which forward the access token
 
 // Fetch all products for a given inventory
 export async function getProductsByInventory(inventoryId: string) {
   if (!inventoryId) return [];
-  const res = await apiFetch(`/api/products/inventory/${inventoryId}`, {
+  const res = await fetch(`/api/products/inventory/${inventoryId}`, {
     method: "GET",
   });
   if (!res.ok) throw new Error("Failed to fetch products");
@@ -13,7 +13,7 @@ export async function getProductsByInventory(inventoryId: string) {
 
 // Fetch a single product
 export async function getProduct(productId: string) {
-  const res = await apiFetch(`/api/products/${productId}`, {
+  const res = await fetch(`/api/products/${productId}`, {
     method: "GET",
   });
   if (!res.ok) throw new Error("Failed to fetch product");
@@ -22,7 +22,7 @@ export async function getProduct(productId: string) {
 
 // Create a new product
 export async function createProduct(data: any) {
-  const res = await apiFetch("/api/products", {
+  const res = await fetch("/api/products", {
     method: "POST",
     body: JSON.stringify(data),
     headers: { "Content-Type": "application/json" },
@@ -33,7 +33,7 @@ export async function createProduct(data: any) {
 
 // Update a product
 export async function updateProduct(productId: string, data: any) {
-  const res = await apiFetch(`/api/products/${productId}`, {
+  const res = await fetch(`/api/products/${productId}`, {
     method: "PUT",
     body: JSON.stringify(data),
     headers: { "Content-Type": "application/json" },
@@ -56,7 +56,7 @@ export async function updateProduct(productId: string, data: any) {
 
 // Delete a product
 export async function deleteProduct(productId: string) {
-  const res = await apiFetch(`/api/products/${productId}`, {
+  const res = await fetch(`/api/products/${productId}`, {
     method: "DELETE",
   });
   if (!res.ok) throw new Error("Failed to delete product");
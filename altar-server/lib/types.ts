@@ -37,6 +37,7 @@ export interface Inventory {
 export type Transaction = {
   transactionId: number;
   productIds: string[];
+  lineItems?: { productId: string; quantity: number; unitPrice: number | null }[];
   total: number;
   userId?: string;
   inventoryId?: string;
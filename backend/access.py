@@ -0,0 +1,106 @@
+import os
+import threading
+from types import SimpleNamespace
+from flask import jsonify
+from helpers import fan_out, get_current_user, get_records
+from cache import TTLCache
+from events import get_broker
+import metrics
+
+# -------------------------
+# Membership cache
+# -------------------------
+# Per user: inventories they own, inventories they can use (owned plus
+# collaborations) and carts they own. A miss costs three fanned-out
+# queries; after that an access check is a set lookup. Writes that change
+# membership publish the user ids on "access" so every worker drops them.
+ACCESS_CHANNEL = "access"
+membership_cache = TTLCache(
+    maxsize=int(os.environ.get("ACCESS_CACHE_SIZE", 4096)),
+    ttl=int(os.environ.get("ACCESS_CACHE_TTL", 300)),
+)
+
+metrics.register_gauge("altar_access_cache", "Inventory membership cache counters", "stat", lambda: membership_cache.stats())
+
+# Bumped on every invalidation, so a load that raced one is not cached
+_generations = {}
+_generations_lock = threading.Lock()
+
+def _load(user_id):
+    owned, shared, carts = fan_out(
+        lambda: get_records("inventory", {"ownerUserId": user_id}).data,
+        lambda: get_records("inventory_users", {"collaboratorUserId": user_id}).data,
+        lambda: get_records("cart", {"ownerUserId": user_id}).data,
+    )
+    owned = {str(row["inventoryId"]) for row in owned}
+    return SimpleNamespace(
+        owned=owned,
+        inventories=owned | {str(row["inventoryId"]) for row in shared},
+        carts={str(row["id"]) for row in carts},
+    )
+
+def get_membership(user_id, refresh=False):
+    """The user's owned inventories, usable inventories and carts, as sets of string ids."""
+    membership = None if refresh else membership_cache.get(user_id)
+    if membership is None:
+        generation = _generations.get(user_id)
+        membership = _load(user_id)
+        with _generations_lock:
+            if _generations.get(user_id) == generation:
+                membership_cache.set(user_id, membership)
+    return membership
+
+def _on_change(message):
+    with _generations_lock:
+        for user_id in message.get("userIds", []):
+            _generations[user_id] = _generations.get(user_id, 0) + 1
+            membership_cache.pop(user_id)
+    # Cart create/delete is applied in place rather than forcing a reload
+    cart = message.get("cart")
+    if cart:
+        membership = membership_cache.get(cart["userId"])
+        if membership is not None:
+            if cart["owned"]:
+                membership.carts.add(cart["id"])
+            else:
+                membership.carts.discard(cart["id"])
+
+get_broker().subscribe(ACCESS_CHANNEL, _on_change)
+
+def invalidate_membership(user_ids):
+    """Drop cached membership for these users in every worker."""
+    user_ids = sorted({str(u) for u in user_ids if u})
+    if user_ids:
+        get_broker().publish(ACCESS_CHANNEL, {"userIds": user_ids})
+
+def record_cart(user_id, cart_id, owned=True):
+    """Add (or with owned=False remove) a cart in the user's cached membership."""
+    get_broker().publish(ACCESS_CHANNEL, {"cart": {"userId": user_id, "id": str(cart_id), "owned": owned}})
+
+# -------------------------
+# Checks
+# -------------------------
+# Each returns None when the request may go ahead, else the error
+# response to return. Ids missing from the cached sets are re-checked
+# against the datastore once, so a grant made elsewhere is never refused;
+# only denials pay that round trip.
+def _check(key, wanted, field):
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if wanted is None or wanted == "":
+        return jsonify({"error": f"Missing {field}"}), 400
+    wanted = str(wanted)
+    if wanted in getattr(get_membership(user.id), key):
+        return None
+    if wanted in getattr(get_membership(user.id, refresh=True), key):
+        return None
+    return jsonify({"error": "Not found"}), 404
+
+def inventory_access_error(inventory_id, owner=False):
+    """Require the current user to own (owner=True) or collaborate on the inventory."""
+    return _check("owned" if owner else "inventories", inventory_id, "inventoryId")
+
+def cart_access_error(cart_id):
+    """Require the current user to own the cart."""
+    return _check("carts", cart_id, "cartId")
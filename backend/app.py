@@ -7,17 +7,39 @@ from collaborators import collab_bp
 from cart import cart_bp
 from inventory_logs import logs_bp
 from transactions import transactions_bp
+from checkout import checkout_bp
+from reports import reports_bp
+from helpers import set_storage
+from storage import open_storage
+from supabase_client import get_client
+import metrics
+import responses
 
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
+def create_app(config=None):
+    """Build the Flask app. `config` is merged into app.config; an
+    ALTAR_STORAGE entry there ("memory", "sqlite:///path", "supabase")
+    selects the storage backend for this process."""
+    app = Flask(__name__)
+    app.config.from_mapping(config or {})
+    if app.config.get("ALTAR_STORAGE"):
+        set_storage(open_storage(app.config["ALTAR_STORAGE"], get_client))
 
-app.register_blueprint(auth_bp, url_prefix="/auth")
-app.register_blueprint(cart_bp, url_prefix="/api")
-app.register_blueprint(inventory_bp, url_prefix="/api/inventory")
-app.register_blueprint(products_bp, url_prefix="/api/products")
-app.register_blueprint(collab_bp, url_prefix="/api/collaborator")
-app.register_blueprint(logs_bp, url_prefix="/api/logs")
-app.register_blueprint(transactions_bp, url_prefix="/api/transactions")
+    CORS(app, supports_credentials=True)
+    metrics.init_app(app)
+    responses.init_app(app)
+
+    app.register_blueprint(auth_bp, url_prefix="/auth")
+    app.register_blueprint(cart_bp, url_prefix="/api")
+    app.register_blueprint(inventory_bp, url_prefix="/api/inventory")
+    app.register_blueprint(products_bp, url_prefix="/api/products")
+    app.register_blueprint(collab_bp, url_prefix="/api/collaborator")
+    app.register_blueprint(logs_bp, url_prefix="/api/logs")
+    app.register_blueprint(transactions_bp, url_prefix="/api/transactions")
+    app.register_blueprint(checkout_bp, url_prefix="/api/checkout")
+    app.register_blueprint(reports_bp, url_prefix="/api/reports")
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from helpers import supabase, exec_sb, get_records, create_record, update_record, delete_record, token_required
+from helpers import get_client, exec_sb, get_records, create_record, update_record, delete_record, fan_out, get_request_token, resolve_user, token_subject
 
 auth_bp = Blueprint("auth_bp", __name__)
 
@@ -11,7 +11,7 @@ def login():
     if not email or not password:
         return jsonify({"error": "Missing credentials"}), 400
 
-    res, err = exec_sb(lambda: supabase.auth.sign_in_with_password({"email": email, "password": password}))
+    res, err = exec_sb(lambda: get_client().auth.sign_in_with_password({"email": email, "password": password}))
     if err or not res.session:
         return jsonify({"error": "Invalid email or password"}), 401
 
@@ -29,7 +29,7 @@ def register():
     if get_records("users", {"userId": userId}).data:
         return jsonify({"error": "userId already taken"}), 400
 
-    res, err = exec_sb(lambda: supabase.auth.sign_up({"email": email, "password": password, "data": {"name": name}}))
+    res, err = exec_sb(lambda: get_client().auth.sign_up({"email": email, "password": password, "data": {"name": name}}))
     if err or not res.user:
         return jsonify({"error": "Failed to create user"}), 400
 
@@ -50,15 +50,22 @@ def update_user(user_id):
     return jsonify({"message": "User updated successfully"}), 200
 
 @auth_bp.route("/me", methods=["GET"])
-@token_required
-def get_current_user(current_user):
+def get_current_user():
     """Get current user info from auth token"""
+    token = get_request_token()
+    if not token:
+        return jsonify({"error": "Token is missing!"}), 401
     try:
+        # Verify the token and look up its user row at the same time;
+        # the row is only used once the token checks out
+        current_user, user_record = fan_out(
+            lambda: resolve_user(token),
+            lambda: get_records("users", {"authId": token_subject(token)}),
+        )
+        if not current_user:
+            return jsonify({"error": "Invalid token!"}), 401
         auth_id = current_user.id if hasattr(current_user, 'id') else current_user.get("id")
         
-        # Try to get user from custom user table
-        user_record = get_records("users", {"authId": auth_id})
-        
         if user_record.data:
             user_data = user_record.data[0]
             return jsonify({
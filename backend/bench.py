@@ -0,0 +1,473 @@
+"""Endpoint benchmark for the POS workload.
+
+Boots app.py in-process against the memory store, adds a fixed delay to
+every datastore call to stand in for the network hop to Supabase, and
+drives terminals that browse an inventory, build carts and check out.
+
+    python bench.py --terminals 8 --rounds 20 --latency-ms 5 --out results.json
+    python bench.py --compare results.json
+    python bench.py --scenario listing --listing-rows 5000
+    python bench.py --scenario serve --threads 8 --duration 10
+    python bench.py --scenario burst --terminals 32 --rounds 20
+
+The listing scenario pages through large transaction and log listings
+once per response encoding (stdlib JSON, orjson, orjson + gzip) so the
+encoder and compression can be compared side by side. The serve
+scenario starts serve.py as a real server against a seeded SQLite store,
+which serve.py runs as one worker: with gthread workers, then with
+gevent workers when gevent is installed. It times the cold start from
+launch to first response, then drives read traffic over HTTP for
+--duration seconds. The burst scenario releases every terminal (one store account)
+at once against cold caches, with single-flight reads off and then on.
+
+Per route it reports throughput, p50/p95/p99 latency, datastore round
+trips and body size per request. Results are saved as JSON (tagged with the git commit)
+so runs can be compared across commits.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import socket
+import tempfile
+import argparse
+import importlib.util
+import http.client
+import contextvars
+import threading
+import subprocess
+
+os.environ.setdefault("ALTAR_STORAGE", "memory")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret-bench-secret-bench-secret")
+
+import jwt
+import helpers
+from storage import MemoryStorage
+
+# -------------------------
+# Stand-in datastore
+# -------------------------
+class LatencyStorage:
+    """Wraps a backend, sleeping `latency` seconds per call and counting calls per request.
+
+    The counter lives in a context variable so calls fanned out to other
+    threads (helpers.fan_out copies the context) still count.
+    """
+
+    def __init__(self, inner, latency):
+        self.inner = inner
+        self.latency = latency
+        self._calls = contextvars.ContextVar("bench_calls", default=None)
+
+    @property
+    def calls(self):
+        counter = self._calls.get()
+        return counter[0] if counter else 0
+
+    def reset(self):
+        self._calls.set([0])
+
+    def __getattr__(self, name):
+        fn = getattr(self.inner, name)
+
+        def call(*args, **kwargs):
+            counter = self._calls.get()
+            if counter is not None:
+                counter[0] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return fn(*args, **kwargs)
+        return call
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+# -------------------------
+# Workload
+# -------------------------
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, round_trips, status, size=0):
+        with self._lock:
+            self.samples.setdefault(route, []).append((seconds, round_trips, status, size))
+
+
+class Terminal:
+    """One POS terminal: a user with its own test client."""
+
+    def __init__(self, app, store, recorder, user_id):
+        self.client = app.test_client()
+        self.store = store
+        self.recorder = recorder
+        token = jwt.encode(
+            {"sub": user_id, "aud": helpers.JWT_AUDIENCE, "exp": int(time.time()) + 3600},
+            helpers.JWT_SECRET,
+        )
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def call(self, route, method, path, headers=None, **kwargs):
+        self.store.reset()
+        start = time.perf_counter()
+        res = self.client.open(path, method=method, headers={**self.headers, **(headers or {})}, **kwargs)
+        self.recorder.add(route, time.perf_counter() - start, self.store.calls, res.status_code, len(res.data))
+        return res
+
+    def round(self, inventory_id, cart_lines):
+        self.call("GET /api/inventory/", "GET", "/api/inventory/")
+        products = self.call(
+            "GET /api/products/inventory/<id>", "GET", f"/api/products/inventory/{inventory_id}"
+        ).get_json()["products"]
+        picked = random.sample(products, min(cart_lines, len(products)))
+        self.call("GET /api/products/<id>", "GET", f"/api/products/{picked[0]['productId']}")
+
+        cart = self.call("POST /api/cart", "POST", "/api/cart", json={"cartName": "bench"}).get_json()
+        for product in picked:
+            for _ in range(random.randint(1, 3)):
+                self.call(
+                    "POST /api/cart/<id>/items", "POST", f"/api/cart/{cart['id']}/items",
+                    json={"productId": product["productId"]},
+                )
+        self.call("GET /api/cart", "GET", "/api/cart")
+        self.call("GET /api/cart/<id>/items", "GET", f"/api/cart/{cart['id']}/items")
+        self.call("POST /api/checkout/<id>", "POST", f"/api/checkout/{cart['id']}")
+        self.call("GET /api/transactions/", "GET", "/api/transactions/")
+
+
+def seed(store, inventories, products_per_inventory, owner):
+    ids = []
+    for i in range(inventories):
+        inv = store.insert("inventory", {"name": f"Store {i}", "ownerUserId": owner}).data[0]
+        store.insert("product", [
+            {
+                "productId": f"p-{i}-{j}",
+                "name": f"Item {j}",
+                "description": f"Bench item {j}",
+                "price": round(random.uniform(1, 20), 2),
+                "stock": 100000,
+                "inventoryId": inv["inventoryId"],
+            }
+            for j in range(products_per_inventory)
+        ])
+        ids.append(inv["inventoryId"])
+    return ids
+
+
+def seed_listings(store, inventory_id, rows, user):
+    store.insert("transactions", [
+        {
+            "userId": user,
+            "inventoryId": inventory_id,
+            "lineItems": [
+                {"productId": f"p-0-{j % 50}", "quantity": 1 + j % 3, "unitPrice": 4.5}
+                for j in range(i % 5 + 1)
+            ],
+            "total": 13.5,
+        }
+        for i in range(rows)
+    ])
+    store.insert("inventory_log", [
+        {
+            "inventoryId": inventory_id,
+            "action": "restock" if i % 2 else "sale",
+            "description": f"Bench log entry {i} for item p-0-{i % 50}",
+            "timestamp": f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}+00:00",
+        }
+        for i in range(rows)
+    ])
+
+
+def run_listing(args, app, store, recorder, inventory_id):
+    """Page through the listings once per response encoding."""
+    from flask.json.provider import DefaultJSONProvider
+    import responses
+
+    encodings = [("stdlib", DefaultJSONProvider(app), False, {})]
+    if responses.orjson is not None:
+        encodings.append(("orjson", responses.OrjsonProvider(app), False, {}))
+        encodings.append(("orjson+gzip", responses.OrjsonProvider(app), True, {"Accept-Encoding": "gzip"}))
+    paths = [
+        ("GET /api/transactions/", f"/api/transactions/?limit={args.page_size}"),
+        ("GET /api/logs/<id>", f"/api/logs/{inventory_id}?limit={args.page_size}"),
+    ]
+    saved = app.json, responses.COMPRESS
+    try:
+        for label, provider, compress, headers in encodings:
+            app.json, responses.COMPRESS = provider, compress
+            terminal = Terminal(app, store, recorder, "bench-user-0")
+            for route, path in paths:
+                for _ in range(args.rounds):
+                    url = path
+                    while url:
+                        res = terminal.call(f"{route} [{label}]", "GET", url, headers=headers)
+                        body = gzip.decompress(res.data) if res.content_encoding == "gzip" else res.data
+                        cursor = json.loads(body).get("nextCursor")
+                        url = cursor and f"{path}&cursor={cursor}"
+    finally:
+        app.json, responses.COMPRESS = saved
+
+
+def run_burst(args, app, store, recorder, inventory_ids):
+    """Opening-time herd: all terminals read the same catalog at the same instant."""
+    from products import catalog_cache
+
+    product_ids = [f"p-0-{i}" for i in range(args.products)]
+    saved_tables = set(helpers.SINGLE_FLIGHT_TABLES)
+    backend_calls = {}
+    try:
+        for label, tables in (("direct", set()), ("single-flight", saved_tables or {"product", "inventory"})):
+            helpers.SINGLE_FLIGHT_TABLES.clear()
+            helpers.SINGLE_FLIGHT_TABLES.update(tables)
+            terminals = [Terminal(app, store, recorder, "bench-user-0") for _ in range(args.terminals)]
+            barrier = threading.Barrier(args.terminals)
+            calls = [0]
+            lock = threading.Lock()
+
+            def drive(terminal, round_no):
+                barrier.wait()
+                product_id = product_ids[round_no % len(product_ids)]
+                for route, path in (
+                    ("GET /api/inventory/", "/api/inventory/"),
+                    ("GET /api/products/inventory/<id>", f"/api/products/inventory/{inventory_ids[0]}"),
+                    ("GET /api/products/<id>", f"/api/products/{product_id}"),
+                ):
+                    terminal.call(f"{route} [{label}]", "GET", path)
+                    with lock:
+                        calls[0] += terminal.store.calls
+
+            for round_no in range(args.rounds):
+                catalog_cache.clear()
+                threads = [threading.Thread(target=drive, args=(t, round_no)) for t in terminals]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            backend_calls[label] = calls[0]
+    finally:
+        helpers.SINGLE_FLIGHT_TABLES.clear()
+        helpers.SINGLE_FLIGHT_TABLES.update(saved_tables)
+    return backend_calls
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path, worker_class, threads):
+    """Launch serve.py; returns (process, port, seconds until it answered)."""
+    port = free_port()
+    env = {**os.environ, "ALTAR_STORAGE": f"sqlite:///{path}", "ALTAR_WORKER_CLASS": worker_class}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}",
+         "--workers", "1", "--threads", str(threads)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    while time.perf_counter() - start < 60:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/metrics")
+            if conn.getresponse().status == 200:
+                return proc, port, time.perf_counter() - start
+        except OSError:
+            time.sleep(0.01)
+    proc.kill()
+    raise RuntimeError("serve.py did not start")
+
+
+def run_serve(args):
+    """Cold start and steady-state throughput of serve.py over real HTTP."""
+    random.seed(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    memory = MemoryStorage(path)
+    inventory_ids = seed(memory, args.inventories, args.products, owner="bench-user-0")
+    seed_listings(memory, inventory_ids[0], args.listing_rows, "bench-user-0")
+    del memory
+    token = jwt.encode(
+        {"sub": "bench-user-0", "aud": helpers.JWT_AUDIENCE, "exp": int(time.time()) + 3600},
+        helpers.JWT_SECRET,
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    routes = [
+        ("GET /api/products/inventory/<id>", lambda: f"/api/products/inventory/{random.choice(inventory_ids)}"),
+        ("GET /api/products/<id>", lambda: f"/api/products/p-0-{random.randrange(args.products)}"),
+        ("GET /api/products/search", lambda: f"/api/products/search?inventoryId={inventory_ids[0]}&q=item+{random.randrange(10)}"),
+        ("GET /api/transactions/", lambda: "/api/transactions/?limit=50"),
+    ]
+
+    result = {"routes": {}, "cold_start_ms": {}, "throughput_rps": 0, "elapsed_s": 0}
+    worker_classes = ["gthread"] + (["gevent"] if importlib.util.find_spec("gevent") else [])
+    for label in worker_classes:
+        proc, port, cold = start_server(path, label, args.threads)
+        result["cold_start_ms"][label] = round(cold * 1000, 1)
+        recorder = Recorder()
+        deadline = time.perf_counter() + args.duration
+
+        def drive():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            while time.perf_counter() < deadline:
+                route, path_for = random.choice(routes)
+                start = time.perf_counter()
+                conn.request("GET", path_for(), headers=headers)
+                res = conn.getresponse()
+                body = res.read()
+                recorder.add(f"{route} [{label}]", time.perf_counter() - start, 0, res.status, len(body))
+
+        threads = [threading.Thread(target=drive) for _ in range(args.terminals)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        proc.terminate()
+        proc.wait()
+        summary = summarize(recorder, elapsed, args)
+        result["routes"].update(summary["routes"])
+        result["throughput_rps"] = max(result["throughput_rps"], summary["throughput_rps"])
+        result["elapsed_s"] = round(result["elapsed_s"] + elapsed, 3)
+        result["commit"] = summary["commit"]
+        result["config"] = summary["config"]
+    return result
+
+
+def run(args):
+    if args.scenario == "serve":
+        return run_serve(args)
+    from app import app
+
+    random.seed(args.seed)
+    memory = MemoryStorage()
+    inventory_ids = seed(memory, args.inventories, args.products, owner="bench-user-0")
+    # Every other terminal works the same stores as a collaborator
+    memory.insert("inventory_users", [
+        {"inventoryId": inventory_id, "collaboratorUserId": f"bench-user-{i}"}
+        for inventory_id in inventory_ids for i in range(1, args.terminals)
+    ])
+    store = LatencyStorage(memory, args.latency_ms / 1000)
+    helpers.set_storage(store)
+
+    recorder = Recorder()
+    if args.scenario == "burst":
+        start = time.perf_counter()
+        backend_calls = run_burst(args, app, store, recorder, inventory_ids)
+        result = summarize(recorder, time.perf_counter() - start, args)
+        result["backend_calls"] = backend_calls
+        return result
+    if args.scenario == "listing":
+        seed_listings(memory, inventory_ids[0], args.listing_rows, "bench-user-0")
+        start = time.perf_counter()
+        run_listing(args, app, store, recorder, inventory_ids[0])
+        return summarize(recorder, time.perf_counter() - start, args)
+
+    terminals = [Terminal(app, store, recorder, f"bench-user-{i}") for i in range(args.terminals)]
+
+    def drive(terminal):
+        for _ in range(args.rounds):
+            terminal.round(random.choice(inventory_ids), args.cart_lines)
+
+    threads = [threading.Thread(target=drive, args=(t,)) for t in terminals]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return summarize(recorder, elapsed, args)
+
+
+def summarize(recorder, elapsed, args):
+    routes = {}
+    total = 0
+    for route, samples in sorted(recorder.samples.items()):
+        latencies = [s[0] * 1000 for s in samples]
+        total += len(samples)
+        routes[route] = {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "round_trips": round(sum(s[1] for s in samples) / len(samples), 2),
+            "errors": sum(1 for s in samples if s[2] >= 500),
+            "kb": round(sum(s[3] for s in samples) / len(samples) / 1024, 1),
+        }
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "routes": routes,
+    }
+
+# -------------------------
+# Reporting
+# -------------------------
+def report(result, baseline=None):
+    print(f"commit {result['commit']}  {result['throughput_rps']} req/s over {result['elapsed_s']}s")
+    for label, ms in result.get("cold_start_ms", {}).items():
+        print(f"cold start to first response, {label}: {ms}ms")
+    for label, calls in result.get("backend_calls", {}).items():
+        print(f"datastore calls, {label}: {calls}")
+    header = f"{'route':<44}{'reqs':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'trips':>7}{'KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for route, r in result["routes"].items():
+        line = (
+            f"{route:<44}{r['requests']:>7}{r['throughput_rps']:>9}"
+            f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['round_trips']:>7}{r.get('kb', 0):>9}"
+        )
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p99_ms"]:
+            line += f"  p99 {100 * (r['p99_ms'] - old['p99_ms']) / old['p99_ms']:+.0f}%"
+            line += f"  trips {r['round_trips'] - old['round_trips']:+.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terminals", type=int, default=8, help="concurrent POS terminals")
+    parser.add_argument("--rounds", type=int, default=10, help="browse/cart/checkout rounds per terminal")
+    parser.add_argument("--inventories", type=int, default=3)
+    parser.add_argument("--products", type=int, default=200, help="products per inventory")
+    parser.add_argument("--cart-lines", type=int, default=8, help="distinct products per cart")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated delay per datastore call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", choices=("pos", "listing", "serve", "burst"), default="pos")
+    parser.add_argument("--listing-rows", type=int, default=5000, help="transactions and logs seeded for --scenario listing")
+    parser.add_argument("--page-size", type=int, default=1000, help="page size for --scenario listing")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker for --scenario serve")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic per server for --scenario serve")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    result = run(args)
+    report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,59 @@
 from flask import Blueprint, request, jsonify
-from helpers import get_current_user, get_records, create_record, update_record, delete_record
+from helpers import conditional_json, get_current_user, get_records, group_by_keys, load_by_keys, create_record, delete_record, call_rpc
+from storage import memory_rpc
+from access import cart_access_error, get_membership, record_cart
 
 cart_bp = Blueprint("cart_bp", __name__)
 
+# Largest change list accepted by the bulk endpoint
+MAX_BULK_CHANGES = 500
+
+# -------------------------
+# Quantity changes
+# -------------------------
+# Each runs as one database function call (migrations/003 and 007), so
+# concurrent scans of the same product cannot lose an increment.
+def apply_cart_changes(cart_id, changes):
+    return call_rpc("cart_apply_changes", {"p_cart_id": str(cart_id), "p_changes": changes}).data
+
+@memory_rpc("cart_apply_changes")
+def _cart_apply_changes(storage, params):
+    deltas = {}
+    for change in params["p_changes"]:
+        deltas[change["productId"]] = deltas.get(change["productId"], 0) + int(change["delta"])
+    touched = []
+    for product_id, delta in deltas.items():
+        existing = storage.select("cart_items", {"cartId": params["p_cart_id"], "productId": product_id}).data
+        if existing:
+            row = storage.update("cart_items", "id", existing[0]["id"], {"quantity": existing[0]["quantity"] + delta}).data[0]
+        else:
+            row = storage.insert("cart_items", {"cartId": params["p_cart_id"], "productId": product_id, "quantity": delta}).data[0]
+        if row["quantity"] <= 0:
+            storage.delete("cart_items", "id", row["id"])
+        touched.append(row)
+    return touched
+
+def _owned_line(storage, params):
+    existing = storage.select("cart_items", {"id": params["p_item_id"]}).data
+    if existing and str(existing[0]["cartId"]) in {str(c) for c in params["p_cart_ids"]}:
+        return existing[0]
+    return None
+
+@memory_rpc("cart_item_decrement")
+def _cart_item_decrement(storage, params):
+    line = _owned_line(storage, params)
+    if line is None:
+        return []
+    if line["quantity"] > 1:
+        return storage.update("cart_items", "id", params["p_item_id"], {"quantity": line["quantity"] - 1}).data
+    return storage.delete("cart_items", "id", params["p_item_id"]).data
+
+@memory_rpc("cart_item_set_quantity")
+def _cart_item_set_quantity(storage, params):
+    if _owned_line(storage, params) is None:
+        return []
+    return storage.update("cart_items", "id", params["p_item_id"], {"quantity": params["p_quantity"]}).data
+
 # Get all carts for current user
 @cart_bp.route("/cart", methods=["GET"])
 def get_carts():
@@ -11,7 +62,37 @@ def get_carts():
         return jsonify({"error": "Unauthorized"}), 401
 
     res = get_records("cart", {"ownerUserId": user.id})
-    return jsonify({"carts": res.data}), 200
+    return conditional_json({"carts": res.data})
+
+# -------------------------
+# Every cart with its lines and products
+# -------------------------
+@cart_bp.route("/cart/snapshot", methods=["GET"])
+def get_cart_snapshot():
+    """All of the user's carts, each with its items and their products.
+
+    Three lookups however many carts and lines there are: the carts, their
+    items (one `in` query on cartId) and the products (load_by_keys).
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    carts = get_records("cart", {"ownerUserId": user.id}).data
+    items = group_by_keys("cart_items", "cartId", (str(cart["id"]) for cart in carts))
+    products = load_by_keys(
+        "product", "productId", (item["productId"] for lines in items.values() for item in lines)
+    )
+    return conditional_json({"carts": [
+        {
+            **cart,
+            "items": [
+                {"id": item["id"], "quantity": item["quantity"], "product": products.get(item["productId"])}
+                for item in items.get(str(cart["id"]), [])
+            ],
+        }
+        for cart in carts
+    ]})
 
 # Create new cart
 @cart_bp.route("/cart", methods=["POST"])
@@ -28,6 +109,7 @@ def create_cart():
     }
 
     res = create_record("cart", cart_data)
+    record_cart(user.id, res.data[0]["id"])
     return jsonify(res.data[0]), 201
 
 # -------------------------
@@ -35,20 +117,19 @@ def create_cart():
 # -------------------------
 @cart_bp.route("/cart/<uuid:cart_id>/items", methods=["GET"])
 def get_cart_items(cart_id):
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    denied = cart_access_error(cart_id)
+    if denied:
+        return denied
 
-    # Fetch cart items with product info
+    # Fetch cart items, then all their products (name, price) in one query
     res = get_records("cart_items", {"cartId": str(cart_id)})
+    products = load_by_keys("product", "productId", (item["productId"] for item in res.data))
     items = []
     for item in res.data:
-        # Include product details (name, price)
-        product = get_records("product", {"productId": item["productId"]}).data
         items.append({
             "id": item["id"],
             "quantity": item["quantity"],
-            "product": product[0] if product else None
+            "product": products.get(item["productId"])
         })
 
     return jsonify({"items": items}), 200
@@ -59,79 +140,102 @@ def get_cart_items(cart_id):
 # -------------------------
 @cart_bp.route("/cart/<uuid:cart_id>/items", methods=["POST"])
 def add_cart_item(cart_id):
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    denied = cart_access_error(cart_id)
+    if denied:
+        return denied
 
     data = request.json
     product_id = data.get("productId")
     if not product_id:
         return jsonify({"error": "Missing productId"}), 400
 
-    # Check if item already exists in cart
-    existing = get_records("cart_items", {"cartId": str(cart_id), "productId": product_id}).data
-    if existing:
-        # Increment quantity
-        update_record("cart_items", "id", existing[0]["id"], {"quantity": existing[0]["quantity"] + 1})
-        return jsonify({"message": "Quantity updated"}), 200
-    else:
-        # Insert new item
-        new_item = create_record("cart_items", {"cartId": str(cart_id), "productId": product_id, "quantity": 1})
-        return jsonify(new_item.data[0]), 201
+    # Insert the line or increment it in one atomic call
+    item = apply_cart_changes(cart_id, [{"productId": product_id, "delta": 1}])[0]
+    if item["quantity"] > 1:
+        return jsonify({"message": "Quantity updated", "item": item}), 200
+    return jsonify(item), 201
 
 
+# -------------------------
+# Apply many quantity changes at once
+# -------------------------
+@cart_bp.route("/cart/<uuid:cart_id>/items/bulk", methods=["POST"])
+def bulk_update_cart_items(cart_id):
+    """Apply {"changes": [{"productId", "delta"}, ...]} in one request, e.g. a scanner burst."""
+    denied = cart_access_error(cart_id)
+    if denied:
+        return denied
+
+    changes = (request.json or {}).get("changes")
+    if not isinstance(changes, list) or not changes or len(changes) > MAX_BULK_CHANGES:
+        return jsonify({"error": f"changes must be a list of 1 to {MAX_BULK_CHANGES} entries"}), 400
+    for change in changes:
+        if not isinstance(change, dict) or not change.get("productId") \
+                or not isinstance(change.get("delta"), int) or isinstance(change["delta"], bool):
+            return jsonify({"error": "Each change needs a productId and an integer delta"}), 400
+
+    items = apply_cart_changes(cart_id, [{"productId": c["productId"], "delta": c["delta"]} for c in changes])
+    return jsonify({"items": items}), 200
+
+
+def _write_own_item(name, params):
+    """Run an item function limited to the user's carts; its rows, or [].
+
+    Item routes do not name the cart, so the cached cart ids go to the
+    database with the write instead of looking the item up first. A miss
+    is retried once with freshly loaded membership, so only a missing or
+    foreign item pays the extra round trip.
+    """
+    user_id = get_current_user().id
+    carts = get_membership(user_id).carts
+    rows = call_rpc(name, {**params, "p_cart_ids": sorted(carts)}).data if carts else []
+    if not rows:
+        fresh = get_membership(user_id, refresh=True).carts
+        if fresh != carts:
+            rows = call_rpc(name, {**params, "p_cart_ids": sorted(fresh)}).data
+    return rows
+
 # -------------------------
 # Remove item from cart
 # -------------------------
 @cart_bp.route("/cart/items/<int:item_id>", methods=["DELETE"])
 def remove_cart_item(item_id):
-    user = get_current_user()
-    if not user:
+    if not get_current_user():
         return jsonify({"error": "Unauthorized"}), 401
 
-    existing = get_records("cart_items", {"id": item_id}).data
-    if not existing:
+    # Decrement, or delete at zero, in one atomic call
+    if not _write_own_item("cart_item_decrement", {"p_item_id": item_id}):
         return jsonify({"error": "Item not found"}), 404
 
-    item = existing[0]
-    if item["quantity"] > 1:
-        update_record("cart_items", "id", item_id, {"quantity": item["quantity"] - 1})
-    else:
-        delete_record("cart_items", "id", item_id)
-
     return jsonify({"success": True}), 200
 
 @cart_bp.route("/cart/items/<int:item_id>", methods=["PATCH"])
 def update_cart_item_quantity(item_id):
-    user = get_current_user()
-    if not user:
+    if not get_current_user():
         return jsonify({"error": "Unauthorized"}), 401
 
     data = request.json
     if "quantity" not in data:
         return jsonify({"error": "Missing quantity"}), 400
 
-    # Get existing item
-    existing = get_records("cart_items", {"id": item_id}).data
-    if not existing:
+    # Update quantity; no row back means the item is not in the user's carts
+    if not _write_own_item("cart_item_set_quantity", {"p_item_id": item_id, "p_quantity": data["quantity"]}):
         return jsonify({"error": "Item not found"}), 404
 
-    # Update quantity
-    update_record("cart_items", "id", item_id, {"quantity": data["quantity"]})
-
     return jsonify({"id": item_id, "quantity": data["quantity"]}), 200
 
 @cart_bp.route("/cart/<uuid:cart_id>", methods=["DELETE"])
 def delete_cart(cart_id):
-    user = get_current_user()
-    if not user:
-        return jsonify({"error": "Unauthorized"}), 401
+    denied = cart_access_error(cart_id)
+    if denied:
+        return denied
 
     try:
         # Delete all items in cart first
         delete_record("cart_items", "cartId", str(cart_id))
         # Delete the cart itself
         delete_record("cart", "id", str(cart_id))
+        record_cart(get_current_user().id, cart_id, owned=False)
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
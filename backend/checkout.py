@@ -0,0 +1,92 @@
+from flask import Blueprint, request, jsonify
+from helpers import get_current_user, call_rpc
+from storage import memory_rpc
+from access import cart_access_error, record_cart
+from products import invalidate_products, publish_product_events
+from transactions import _transaction_json
+from reports import record_sale
+
+checkout_bp = Blueprint("checkout_bp", __name__)
+
+# -------------------------
+# Checkout function
+# -------------------------
+# Stock, the transaction and the cart removal are written together by one
+# database function (migrations/006_checkout.sql), so a failure leaves
+# nothing half done and stock is decremented in place, never rewritten
+# from an earlier read.
+@memory_rpc("checkout_cart")
+def _checkout_cart(storage, params):
+    cart_id = params["p_cart_id"]
+    if not storage.select("cart", {"id": cart_id, "ownerUserId": params["p_owner_id"]}).data:
+        return {"error": "not_found"}
+    quantities = {}
+    for line in storage.select("cart_items", {"cartId": cart_id}).data:
+        quantities[line["productId"]] = quantities.get(line["productId"], 0) + line["quantity"]
+    if not quantities:
+        return {"error": "empty"}
+    products = {row["productId"]: row for row in storage.select_in("product", "productId", list(quantities)).data}
+    missing = [pid for pid in quantities if pid not in products]
+    if missing:
+        return {"error": "missing", "productIds": missing}
+
+    sold = []
+    for pid in sorted(quantities):
+        stock = products[pid].get("stock")
+        changes = {"updated_at": "now()"}
+        if stock is not None:
+            changes["stock"] = max(stock - quantities[pid], 0)
+        sold.extend(storage.update("product", "productId", pid, changes).data)
+    transaction = storage.insert("transactions", {
+        "lineItems": [
+            {"productId": row["productId"], "quantity": quantities[row["productId"]], "unitPrice": float(row["price"])}
+            for row in sold
+        ],
+        "total": sum(float(row["price"]) * quantities[row["productId"]] for row in sold),
+        "userId": params["p_user_id"],
+        "inventoryId": sold[0].get("inventoryId"),
+    }).data[0]
+    storage.delete("cart_items", "cartId", cart_id)
+    storage.delete("cart", "id", cart_id)
+    return {"transaction": transaction, "products": sold}
+
+# -------------------------
+# Check out a cart
+# -------------------------
+@checkout_bp.route("/<uuid:cart_id>", methods=["POST"])
+def checkout(cart_id):
+    """Turn a cart into a transaction in one request.
+
+    Prices and stock come from the stored product rows, not the client.
+    The sale is one database call; the sales rollup is a second.
+    """
+    denied = cart_access_error(cart_id)
+    if denied:
+        return denied
+    user = get_current_user()
+    data = request.get_json(silent=True) or {}
+
+    try:
+        result = call_rpc("checkout_cart", {
+            "p_cart_id": str(cart_id),
+            "p_owner_id": user.id,
+            "p_user_id": data.get("userId") or user.id,
+        }).data
+    except Exception as e:
+        print(f"Checkout error: {str(e)}")
+        return jsonify({"error": f"Checkout failed: {str(e)}"}), 500
+
+    error = (result or {}).get("error")
+    if error == "not_found" or not result:
+        return jsonify({"error": "Cart not found"}), 404
+    if error == "empty":
+        return jsonify({"error": "Cart is empty"}), 400
+    if error == "missing":
+        return jsonify({"error": "Products no longer exist", "productIds": result["productIds"]}), 409
+
+    # The sale is committed; what follows only refreshes derived state
+    record_cart(user.id, cart_id, owned=False)
+    invalidate_products(result["products"])
+    publish_product_events("updated", result["products"])
+    record_sale(result["transaction"])
+    return jsonify({"transaction": _transaction_json(result["transaction"])}), 201
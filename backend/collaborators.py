@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
-from helpers import create_record, get_records, delete_record
+from helpers import conditional_json, create_record, get_records, delete_record
+from access import inventory_access_error, invalidate_membership
 
 collab_bp = Blueprint("collab_bp", __name__)
 
@@ -8,20 +9,31 @@ def add_collaborator():
     data = request.json
     if not data.get("inventoryId") or not data.get("collaboratorUserId"):
         return jsonify({"error": "Missing collaborator details"}), 400
+    denied = inventory_access_error(data["inventoryId"], owner=True)
+    if denied:
+        return denied
     create_record("inventory_users", {
         "inventoryId": data["inventoryId"],
         "collaboratorUserId": data["collaboratorUserId"],
         "added_at": "now()"
     })
+    invalidate_membership([data["collaboratorUserId"]])
     return jsonify({"message": "Collaborator added successfully"}), 201
 
 @collab_bp.route("/<int:inventory_id>", methods=["GET"])
 def get_collaborators(inventory_id):
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
     res = get_records("inventory_users", {"inventoryId": inventory_id})
-    return jsonify({"collaborators": res.data}), 200
+    return conditional_json({"collaborators": res.data})
 
 @collab_bp.route("/", methods=["DELETE"])
 def remove_collaborator():
     data = request.json
-    delete_record("inventory_users", "inventoryId", data.get("inventoryId"))
+    denied = inventory_access_error(data.get("inventoryId"), owner=True)
+    if denied:
+        return denied
+    res = delete_record("inventory_users", "inventoryId", data.get("inventoryId"))
+    invalidate_membership(row.get("collaboratorUserId") for row in res.data)
     return jsonify({"message": "Collaborator removed successfully"}), 200
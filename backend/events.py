@@ -0,0 +1,93 @@
+import os
+import json
+import threading
+
+# -------------------------
+# Pub/sub brokers
+# -------------------------
+class LocalBroker:
+    """In-process pub/sub; enough when a single worker serves the app."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """Call `callback(message)` for every message on `channel`; returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers.get(channel, []):
+                    self._subscribers[channel].remove(callback)
+        return unsubscribe
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def after_fork(self):
+        """Called once in a forked worker; subscriptions made before the fork carry over."""
+        self._lock = threading.Lock()
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                print(f"Subscriber error on {channel}: {str(e)}")
+
+
+class RedisBroker(LocalBroker):
+    """Fans messages out to every worker through Redis pub/sub.
+
+    Publishing only goes to Redis; a listener thread delivers each message
+    (including this worker's own) to local subscribers exactly once.
+    """
+
+    PREFIX = "altar:"
+
+    def __init__(self, url):
+        super().__init__()
+        self._url = url
+        self._connect()
+
+    def _connect(self):
+        import redis
+
+        self._redis = redis.Redis.from_url(self._url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(f"{self.PREFIX}*")
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def after_fork(self):
+        # The parent's connection and listener thread are not ours to use
+        super().after_fork()
+        self._connect()
+
+    def publish(self, channel, message):
+        self._redis.publish(f"{self.PREFIX}{channel}", json.dumps(message, default=str))
+
+    def _listen(self):
+        for item in self._pubsub.listen():
+            channel = item["channel"].decode()[len(self.PREFIX):]
+            self._deliver(channel, json.loads(item["data"]))
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    """Broker shared by the whole process; set ALTAR_BROKER_URL=redis://... to span workers."""
+    global _broker, _broker_pid
+    with _broker_lock:
+        if _broker is None:
+            url = os.environ.get("ALTAR_BROKER_URL")
+            _broker = RedisBroker(url) if url else LocalBroker()
+        elif _broker_pid != os.getpid():
+            _broker.after_fork()
+        _broker_pid = os.getpid()
+    return _broker
@@ -1,27 +1,170 @@
-from supabase import create_client
-from flask import request
+from flask import Response, current_app, request
 from dotenv import load_dotenv
+from types import SimpleNamespace
+from cache import TTLCache
+from storage import Result, open_storage
+from supabase_client import get_client
+import metrics
+from responses import matching_etag
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime
+import threading
+import base64
+import hashlib
+import json
+import jwt
 import os
+import time
 
 load_dotenv()
 
-supabase = create_client(
-    os.environ["SUPABASE_URL"],
-    os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-)
+# -------------------------
+# Client / storage
+# -------------------------
+# Both are opened on first use so importing helpers needs no credentials;
+# get_client() is the single shared, pooled client from supabase_client
+_storage = None
+_init_lock = threading.RLock()
+
+def get_storage():
+    global _storage
+    with _init_lock:
+        if _storage is None:
+            _storage = open_storage(os.environ.get("ALTAR_STORAGE", "supabase"), get_client)
+    return _storage
+
+def set_storage(storage):
+    """Swap the backend, e.g. a MemoryStorage for load tests."""
+    global _storage
+    _storage = storage
 
 # -------------------------
 # Auth helpers
 # -------------------------
-def get_current_user():
+JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = "authenticated"
+# Accepted signing algorithms, fixed by configuration rather than read from
+# the token: the shared secret when set, otherwise the project's JWKS keys
+JWT_ALGORITHMS = ["HS256"] if JWT_SECRET else ["RS256", "ES256"]
+
+# Verified users keyed by access token; entries never outlive the token's exp
+auth_cache = TTLCache(
+    maxsize=int(os.environ.get("AUTH_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("AUTH_CACHE_TTL", 300)),
+)
+metrics.register_gauge("altar_auth_cache", "Verified-token cache counters", "stat", lambda: auth_cache.stats())
+_jwks_client = None
+
+def _signing_key(token):
+    global _jwks_client
+    if JWT_SECRET:
+        return JWT_SECRET
+    if jwt.get_unverified_header(token).get("alg") not in JWT_ALGORITHMS:
+        # Not verifiable here (e.g. an HS256 project without the secret set)
+        return None
+    # Asymmetric project keys are published on the auth server's JWKS endpoint
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(f"{os.environ['SUPABASE_URL']}/auth/v1/.well-known/jwks.json")
+    return _jwks_client.get_signing_key_from_jwt(token).key
+
+def warm_signing_keys():
+    """Fetch the project's JWKS ahead of the first request (no-op with an HS256 secret)."""
+    global _jwks_client
+    if JWT_SECRET or not os.environ.get("SUPABASE_URL"):
+        return
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(f"{os.environ['SUPABASE_URL']}/auth/v1/.well-known/jwks.json")
+    _jwks_client.get_signing_keys()
+
+def _user_from_claims(claims):
+    return SimpleNamespace(
+        id=claims["sub"],
+        email=claims.get("email"),
+        role=claims.get("role"),
+        aud=claims.get("aud"),
+        user_metadata=claims.get("user_metadata") or {},
+        app_metadata=claims.get("app_metadata") or {},
+    )
+
+def resolve_user(token):
+    """Return the user for an access token, or None if it is missing, invalid or expired.
+
+    Tokens are verified locally (signature + exp) when the signing key is
+    available; otherwise the auth server is asked once and the answer is
+    cached until the token expires.
+    """
+    if not token:
+        return None
+    user = auth_cache.get(token)
+    if user is not None:
+        return user
     try:
-        token = request.headers.get("Authorization", "").replace("Bearer ", "")
-        if not token:
-            return None
-        user = supabase.auth.get_user(token)
-        return user.user
+        key = _signing_key(token)
+        if key:
+            claims = jwt.decode(
+                token, key, algorithms=JWT_ALGORITHMS, audience=JWT_AUDIENCE,
+                options={"require": ["exp", "sub"]},
+            )
+            user = _user_from_claims(claims)
+        else:
+            claims = jwt.decode(token, options={"verify_signature": False})
+            user = get_client().auth.get_user(token).user
     except Exception:
         return None
+    if not user:
+        return None
+    auth_cache.set(token, user, ttl=claims.get("exp", 0) - time.time())
+    return user
+
+def token_subject(token):
+    """The unverified `sub` claim, for lookups that run alongside verification."""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("sub")
+    except Exception:
+        return None
+
+def get_request_token():
+    return request.headers.get("Authorization", "").replace("Bearer ", "")
+
+def get_current_user():
+    return resolve_user(get_request_token())
+
+# -------------------------
+# Concurrent fan-out
+# -------------------------
+_pool = None
+_pool_pid = None
+_in_fan_out = contextvars.ContextVar("in_fan_out", default=False)
+
+def _fan_out_pool():
+    global _pool, _pool_pid
+    # A pool inherited through fork has no live threads; start a fresh one
+    with _init_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=int(os.environ.get("ALTAR_FANOUT_WORKERS", 16)),
+                thread_name_prefix="fan-out",
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+def _run_fanned(fn):
+    _in_fan_out.set(True)
+    return fn()
+
+def fan_out(*fns):
+    """Run independent calls concurrently and return their results in order.
+
+    Each call sees a copy of the caller's context (request, g). Calls made
+    from inside a fan-out run inline, so nesting cannot exhaust the pool.
+    The first exception is re-raised.
+    """
+    if len(fns) < 2 or _in_fan_out.get():
+        return [fn() for fn in fns]
+    pool = _fan_out_pool()
+    futures = [pool.submit(contextvars.copy_context().run, _run_fanned, fn) for fn in fns]
+    return [f.result() for f in futures]
 
 # -------------------------
 # Supabase helpers
@@ -32,20 +175,234 @@ def exec_sb(fn):
     except Exception as e:
         return None, str(e)
 
+def _timed(op, table, fn, *args):
+    # Every primitive below is counted and timed per op and table for /metrics
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = fn(*args)
+        failed = False
+        return result
+    finally:
+        metrics.record_datastore(op, table, time.perf_counter() - start, failed)
+
+# -------------------------
+# Single-flight reads
+# -------------------------
+# For opted-in tables, identical get_records calls that overlap in time
+# share one datastore call: the first caller runs it, later ones wait for
+# its result. Nothing is cached once the call returns. Every write to an
+# opted-in table bumps that table's generation, which is part of the key,
+# so a read issued after a write never joins a flight started before it.
+SINGLE_FLIGHT_TABLES = {
+    t.strip() for t in os.environ.get("ALTAR_SINGLE_FLIGHT_TABLES", "product,inventory").split(",") if t.strip()
+}
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.rows = None
+        self.error = None
+        self.waiters = 0
+
+_flights = {}
+_flights_lock = threading.Lock()
+_table_generations = {}
+
+def single_flight(table, enabled=True):
+    """Opt a table in to (or out of) coalesced get_records calls."""
+    if enabled:
+        SINGLE_FLIGHT_TABLES.add(table)
+    else:
+        SINGLE_FLIGHT_TABLES.discard(table)
+
+def _wrote(tables):
+    # Detach in-flight reads of these tables from later callers
+    with _flights_lock:
+        for table in tables:
+            if table in SINGLE_FLIGHT_TABLES:
+                _table_generations[table] = _table_generations.get(table, 0) + 1
+
+def _coalesced(table, filters, fn):
+    with _flights_lock:
+        key = (
+            table, _table_generations.get(table, 0),
+            tuple(sorted((k, str(v)) for k, v in (filters or {}).items())),
+        )
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            flight.waiters += 1
+    metrics.single_flight_calls.inc((table, "leader" if leader else "shared"))
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        # Callers may modify their rows, so each waiter gets its own copies
+        return Result([dict(row) for row in flight.rows], getattr(flight.result, "count", None))
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+            waited = flight.waiters
+        if waited and flight.result is not None:
+            # Copied before the leader gets its rows back and may change them
+            flight.rows = [dict(row) for row in flight.result.data]
+        flight.done.set()
+
 def get_records(table, filters=None):
-    q = supabase.table(table).select("*")
-    for k, v in (filters or {}).items():
-        q = q.eq(k, v)
-    return q.execute()
+    read = lambda: _timed("get_records", table, get_storage().select, table, filters)
+    if table in SINGLE_FLIGHT_TABLES:
+        return _coalesced(table, filters, read)
+    return read()
+
+def get_records_in(table, field, values, filters=None):
+    return _timed("get_records_in", table, get_storage().select_in, table, field, values, filters)
+
+# Keep the `in.(...)` list well inside PostgREST's URL length limit
+BATCH_SIZE = 200
+
+def _select_in_batches(table, field, keys, filters):
+    # One `in` query per BATCH_SIZE distinct keys, run concurrently
+    keys = list(dict.fromkeys(k for k in keys if k is not None))
+    batches = fan_out(*(
+        lambda chunk=keys[i:i + BATCH_SIZE]: get_records_in(table, field, chunk, filters).data
+        for i in range(0, len(keys), BATCH_SIZE)
+    ))
+    return [row for batch in batches for row in batch]
+
+def load_by_keys(table, field, keys, filters=None):
+    """Resolve many keys with one `in` query per BATCH_SIZE keys, run concurrently.
+
+    Returns {key: row}; keys with no matching row are simply absent.
+    """
+    return {row[field]: row for row in _select_in_batches(table, field, keys, filters)}
+
+def group_by_keys(table, field, keys, filters=None):
+    """Like load_by_keys, for one-to-many lookups: returns {key: [rows]}."""
+    groups = {}
+    for row in _select_in_batches(table, field, keys, filters):
+        groups.setdefault(row[field], []).append(row)
+    return groups
+
+def get_page(table, filters=None, order_by=("created_at", "id"), cursor=None,
+             limit=100, since=None, until=None, descending=True):
+    """Keyset pagination over (order_by[0], order_by[1]).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    `since`/`until` bound the first order column as [since, until).
+    """
+    after = decode_cursor(cursor) if cursor else None
+    rows = _timed(
+        "get_page", table, get_storage().select_page,
+        table, filters, order_by, after, limit, since, until, descending,
+    ).data
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor([rows[-1].get(order_by[0]), rows[-1].get(order_by[1])])
+    return rows, next_cursor
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def _position(values):
+    # A keyset position is two column values: text, integers or null
+    return isinstance(values, list) and len(values) == 2 and all(
+        v is None or isinstance(v, str) or (isinstance(v, int) and not isinstance(v, bool))
+        for v in values
+    )
+
+def decode_cursor(cursor, nested=False):
+    """Raises ValueError for a cursor this server did not issue.
+
+    With nested=True the cursor holds two positions (each may be null),
+    as the product sync cursor does.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    valid = (
+        isinstance(values, list) and len(values) == 2 and all(v is None or _position(v) for v in values)
+        if nested else _position(values)
+    )
+    if not valid:
+        raise ValueError("Invalid cursor")
+    return values
+
+def valid_timestamp(value):
+    """True for None or an ISO 8601 date/time, as accepted for since/until."""
+    if value is None:
+        return True
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+def _write(op, table, fn, *args):
+    try:
+        return _timed(op, table, fn, *args)
+    finally:
+        _wrote([table])
 
 def create_record(table, payload):
-    return supabase.table(table).insert(payload).execute()
+    return _write("create_record", table, get_storage().insert, table, payload)
+
+def upsert_records(table, rows, on_conflict):
+    return _write("upsert_records", table, get_storage().upsert, table, rows, on_conflict)
 
 def update_record(table, field, value, payload):
-    return supabase.table(table).update(payload).eq(field, value).execute()
+    return _write("update_record", table, get_storage().update, table, field, value, payload)
 
 def delete_record(table, field, value):
-    return supabase.table(table).delete().eq(field, value).execute()
+    return _write("delete_record", table, get_storage().delete, table, field, value)
+
+def delete_records_in(table, field, values):
+    return _write("delete_records_in", table, get_storage().delete_in, table, field, values)
+
+def call_rpc(name, params):
+    """Run a database function from migrations/ (memory stores use the Python stand-in)."""
+    try:
+        return _timed("call_rpc", name, get_storage().rpc, name, params)
+    finally:
+        # A function may write any table, so every coalesced table starts over
+        _wrote(list(SINGLE_FLIGHT_TABLES))
+
+
+# -------------------------
+# Conditional JSON responses
+# -------------------------
+def serialize(payload):
+    """(body, etag) for a JSON payload; the ETag hashes the exact bytes sent."""
+    body = current_app.json.dumps(payload)
+    return body, hashlib.blake2b(body.encode(), digest_size=16).hexdigest()
+
+def conditional_json(payload=None, serialized=None):
+    """200 with a strong ETag, or an empty 304 if If-None-Match already has it.
+
+    Pass a cached `serialized` (body, etag) pair to answer without
+    serializing again.
+    """
+    body, etag = serialized or serialize(payload)
+    matched = matching_etag(etag)
+    if matched:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+    return response
 
 
 # -------------------------# Token decorator
@@ -55,11 +412,11 @@ from flask import jsonify
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get("Authorization", "").replace("Bearer ", "")
+        token = get_request_token()
         if not token:
             return jsonify({"error": "Token is missing!"}), 401
-        user = supabase.auth.get_user(token)
-        if not user.user:
+        user = resolve_user(token)
+        if not user:
             return jsonify({"error": "Invalid token!"}), 401
-        return f(current_user=user.user, *args, **kwargs)
+        return f(current_user=user, *args, **kwargs)
     return decorated
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 import supabase
-from helpers import get_current_user, get_records, create_record, update_record, delete_record
+from helpers import conditional_json, get_current_user, get_records, create_record, update_record, delete_record
+from access import invalidate_membership
 
 inventory_bp = Blueprint("inventory_bp", __name__)
 
@@ -10,7 +11,7 @@ def get_inventory():
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
     res = get_records("inventory", {"ownerUserId": user.id})
-    return jsonify(res.data), 200
+    return conditional_json(res.data)
     
 
 @inventory_bp.route("/", methods=["POST"])
@@ -22,6 +23,7 @@ def create_inventory():
     if not data.get("name"):
         return jsonify({"error": "Missing inventory name"}), 400
     res = create_record("inventory", {"name": data["name"], "ownerUserId": user.id})
+    invalidate_membership([user.id])
     return jsonify(res.data[0]), 201
 
 # In your Flask backend
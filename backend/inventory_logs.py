@@ -1,19 +1,54 @@
+import os
+import click
+from datetime import datetime, timedelta, timezone
 from flask import Blueprint, request, jsonify
-from helpers import create_record, get_records, delete_record
+from helpers import create_record, get_page, decode_cursor, delete_record, delete_records_in
+from log_writer import emit
+from access import inventory_access_error
 
-logs_bp = Blueprint("logs_bp", __name__)
+logs_bp = Blueprint("logs_bp", __name__, cli_group="logs")
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Newest first; id breaks timestamp ties
+ORDER = ("timestamp", "id")
+RETENTION_DAYS = int(os.environ.get("ALTAR_LOG_RETENTION_DAYS", 90))
 
 @logs_bp.route("/<int:inventory_id>", methods=["GET"])
 def get_inventory_logs(inventory_id):
-    res = get_records("inventory_log", {"inventoryId": inventory_id})
-    return jsonify({"logs": res.data}), 200
+    """One page of an inventory's logs, newest first.
+
+    since/until bound the timestamp; pass the returned nextCursor back as
+    `cursor` for the next page.
+    """
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    cursor = request.args.get("cursor")
+    try:
+        limit = min(int(request.args.get("limit", PAGE_SIZE)), MAX_PAGE_SIZE)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    logs, next_cursor = get_page(
+        "inventory_log", {"inventoryId": inventory_id}, ORDER, cursor, limit,
+        request.args.get("since"), request.args.get("until"),
+    )
+    return jsonify({"logs": logs, "nextCursor": next_cursor}), 200
 
 @logs_bp.route("/", methods=["POST"])
 def add_inventory_log():
     data = request.json
     if not data.get("inventoryId") or not data.get("action"):
         return jsonify({"error": "Missing log details"}), 400
-    create_record("inventory_log", {
+    denied = inventory_access_error(data["inventoryId"])
+    if denied:
+        return denied
+    emit("inventory_log", {
         "inventoryId": data["inventoryId"],
         "action": data["action"],
         "timestamp": "now()"
@@ -22,5 +57,31 @@ def add_inventory_log():
 
 @logs_bp.route("/<int:inventory_id>", methods=["DELETE"])
 def clear_inventory_logs(inventory_id):
+    denied = inventory_access_error(inventory_id, owner=True)
+    if denied:
+        return denied
     delete_record("inventory_log", "inventoryId", inventory_id)
     return jsonify({"message": "Inventory logs cleared successfully"}), 200
+
+# -------------------------
+# Retention
+# -------------------------
+@logs_bp.cli.command("apply-retention")
+@click.option("--days", default=RETENTION_DAYS, show_default=True, help="keep logs newer than this")
+@click.option("--mode", type=click.Choice(["archive", "delete"]), default="archive", show_default=True)
+@click.option("--batch-size", default=500, show_default=True)
+def apply_retention(days, mode, batch_size):
+    """Move (or delete) logs older than --days, oldest first, one batch at a time."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    moved = 0
+    while True:
+        # Each batch removes what it read, so the first page is always the next batch
+        rows, _ = get_page("inventory_log", None, ORDER, None, batch_size, until=cutoff, descending=False)
+        if not rows:
+            break
+        if mode == "archive":
+            create_record("inventory_log_archive", rows)
+        delete_records_in("inventory_log", "id", [row["id"] for row in rows])
+        moved += len(rows)
+        click.echo(f"{mode}d {moved} logs older than {cutoff}")
+    click.echo(f"done: {moved} logs {mode}d")
@@ -0,0 +1,171 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from helpers import create_record
+from storage import now_iso
+import metrics
+
+# -------------------------
+# Buffered batch writer
+# -------------------------
+BUFFERED = os.environ.get("ALTAR_LOG_BUFFER", "0") == "1"
+BATCH_SIZE = int(os.environ.get("ALTAR_LOG_BATCH_SIZE", 200))
+FLUSH_INTERVAL = float(os.environ.get("ALTAR_LOG_FLUSH_INTERVAL", 1.0))
+MAX_QUEUE = int(os.environ.get("ALTAR_LOG_MAX_QUEUE", 10000))
+# Attempts for a whole batch before it is split to find the rows that fail
+MAX_RETRIES = int(os.environ.get("ALTAR_LOG_MAX_RETRIES", 3))
+
+
+class BatchWriter:
+    """Queues rows for one table and inserts them in batches from a background thread.
+
+    A batch is written once it reaches `batch_size` rows or `interval`
+    seconds after its first row. When the queue is full the caller writes
+    its row synchronously instead, so producers slow down rather than drop
+    entries. A batch that keeps failing is split until the rows the
+    datastore rejects are isolated; only those are dropped (and counted).
+    close() waits until everything queued has been written.
+    """
+
+    def __init__(self, table, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE):
+        self.table = table
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "sync_writes": 0, "failed_batches": 0, "dropped": 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        # Held while checking _closed and queueing, so no row is queued after close()
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{table}", daemon=True)
+        self._thread.start()
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, n in deltas.items():
+                self.stats[key] += n
+
+    def write(self, row):
+        with self._close_lock:
+            if not self._closed.is_set():
+                try:
+                    self._queue.put_nowait(row)
+                    self._count(queued=1)
+                    return
+                except queue.Full:
+                    pass
+        self._count(sync_writes=1)
+        create_record(self.table, row)
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        # Retry the whole batch (in order) a few times, as most failures are
+        # transient; then split it so one bad row cannot hold up the rest
+        for attempt in range(MAX_RETRIES):
+            try:
+                create_record(self.table, batch)
+                self._count(written=len(batch), batches=1)
+                return
+            except Exception as e:
+                self._count(failed_batches=1)
+                print(f"Log writer failed to insert {len(batch)} rows into {self.table}: {str(e)}")
+                if attempt + 1 < MAX_RETRIES and self._closed.wait(self.interval):
+                    break
+        self._split(batch)
+
+    def _split(self, rows):
+        # `rows` just failed as one insert: halve it until each failure is one row
+        if len(rows) == 1:
+            self._count(dropped=1)
+            print(f"Log writer dropped a row the datastore rejected for {self.table}: {rows[0]}")
+            return
+        for half in (rows[:len(rows) // 2], rows[len(rows) // 2:]):
+            try:
+                create_record(self.table, half)
+                self._count(written=len(half), batches=1)
+            except Exception:
+                self._split(half)
+
+    def _run(self):
+        while not self._closed.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write_batch(batch)
+        self._drain()
+
+    def _drain(self):
+        # Runs on the writer thread once closed, after its last batch
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(rows), self.batch_size):
+            self._write_batch(rows[i:i + self.batch_size])
+
+    def close(self):
+        """Stop accepting rows and wait until the writer thread has written
+        everything still queued. Later write() calls insert directly."""
+        with self._close_lock:
+            self._closed.set()
+        self._thread.join()
+
+    def counters(self):
+        with self._stats_lock:
+            return {**self.stats, "depth": self.depth()}
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+_writers = {}
+_writers_pid = None
+_writers_lock = threading.Lock()
+
+def get_writer(table):
+    """Shared writer per table; a forked worker starts its own."""
+    global _writers, _writers_pid
+    with _writers_lock:
+        if _writers_pid != os.getpid():
+            _writers, _writers_pid = {}, os.getpid()
+        if table not in _writers:
+            _writers[table] = BatchWriter(table)
+            metrics.register_gauge(
+                f"altar_log_writer_{table}", f"Buffered writer counters for {table}", "stat",
+                lambda w=_writers[table]: w.counters(),
+            )
+    return _writers[table]
+
+def emit(table, row):
+    """Write a log-style row without waiting on the datastore when ALTAR_LOG_BUFFER=1.
+
+    "now()" values are stamped when the row is emitted, not when its batch
+    is flushed. Without buffering this is a plain create_record.
+    """
+    if not BUFFERED:
+        return create_record(table, row)
+    get_writer(table).write({k: now_iso() if v == "now()" else v for k, v in row.items()})
+
+@atexit.register
+def close_all():
+    global _writers
+    with _writers_lock:
+        writers = list(_writers.values()) if _writers_pid == os.getpid() else []
+        _writers = {}
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,172 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from flask import Response, g, request
+
+# -------------------------
+# Metric types
+# -------------------------
+# Buckets in seconds, shared by request and datastore latency histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(keys, values):
+    return ",".join(f'{k}="{v}"' for k, v in zip(keys, values))
+
+
+class Counter:
+    def __init__(self, name, help, labelnames):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames, buckets=BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self._lock:
+            # [cumulative bucket counts..., count, sum]
+            state = self._values.setdefault(labels, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += seconds
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, state in sorted(self._values.items()):
+                *counts, n, total = state
+                base = _labels(self.labelnames, labels)
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {n}')
+                lines.append(f"{self.name}_sum{{{base}}} {total}")
+                lines.append(f"{self.name}_count{{{base}}} {n}")
+        return lines
+
+# -------------------------
+# Registry
+# -------------------------
+request_latency = Histogram(
+    "altar_request_duration_seconds", "Request latency by route", ("method", "endpoint")
+)
+request_count = Counter(
+    "altar_requests_total", "Requests by route and status", ("method", "endpoint", "status")
+)
+datastore_latency = Histogram(
+    "altar_datastore_call_duration_seconds", "Datastore helper latency by primitive and table", ("op", "table")
+)
+route_datastore_calls = Counter(
+    "altar_route_datastore_calls_total", "Datastore helper calls made while serving each route",
+    ("method", "endpoint", "op", "table"),
+)
+route_datastore_seconds = Counter(
+    "altar_route_datastore_seconds_total", "Time in datastore helpers while serving each route",
+    ("method", "endpoint", "op", "table"),
+)
+datastore_errors = Counter(
+    "altar_datastore_errors_total", "Datastore helper calls that raised", ("op", "table")
+)
+single_flight_calls = Counter(
+    "altar_single_flight_calls_total",
+    "Coalesced get_records calls: leaders ran the query, shared ones reused a leader's result",
+    ("table", "role"),
+)
+
+METRICS = [
+    request_latency, request_count, datastore_latency,
+    route_datastore_calls, route_datastore_seconds, datastore_errors, single_flight_calls,
+]
+# name -> callable returning {label_value: number}, e.g. cache hit/miss stats
+_gauges = {}
+
+def register_gauge(name, help, label, fn):
+    _gauges[name] = (help, label, fn)
+
+def expose():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    for name, (help, label, fn) in sorted(_gauges.items()):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        for key, value in sorted(fn().items()):
+            lines.append(f'{name}{{{label}="{key}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+# -------------------------
+# Per-request datastore breakdown
+# -------------------------
+_calls = contextvars.ContextVar("datastore_calls", default=None)
+
+def record_datastore(op, table, seconds, failed=False):
+    datastore_latency.observe((op, table), seconds)
+    if failed:
+        datastore_errors.inc((op, table))
+    calls = _calls.get()
+    if calls is not None:
+        calls.append((op, table, seconds))
+
+# -------------------------
+# Flask wiring
+# -------------------------
+SLOW_REQUEST_MS = float(os.environ.get("ALTAR_SLOW_REQUEST_MS", 0))
+slow_log = logging.getLogger("altar.slow")
+
+def init_app(app):
+    """Time every request, expose GET /metrics and, with ALTAR_SLOW_REQUEST_MS
+    set, log slow requests with their datastore call breakdown."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        # A list shared with fanned-out calls (they copy this context)
+        _calls.set([])
+
+    @app.after_request
+    def _record(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        request_latency.observe((request.method, endpoint), elapsed)
+        request_count.inc((request.method, endpoint, str(response.status_code)))
+
+        calls = _calls.get() or []
+        for op, table, seconds in calls:
+            route_datastore_calls.inc((request.method, endpoint, op, table))
+            route_datastore_seconds.inc((request.method, endpoint, op, table), seconds)
+
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            breakdown = {}
+            for op, table, seconds in calls:
+                n, total = breakdown.get((op, table), (0, 0.0))
+                breakdown[(op, table)] = (n + 1, total + seconds)
+            slow_log.warning(
+                "slow request %s %s %d %.1fms, %d datastore calls: %s",
+                request.method, request.path, response.status_code, elapsed * 1000, len(calls),
+                ", ".join(f"{op}({table}) x{n} {total * 1000:.1f}ms" for (op, table), (n, total) in breakdown.items()),
+            )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(expose(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,4 @@
+-- Transactions store one (productId, quantity, unitPrice) entry per product
+-- instead of repeating productId once per unit.
+alter table transactions add column if not exists "lineItems" jsonb;
+alter table transactions alter column "productIds" drop not null;
@@ -0,0 +1,25 @@
+-- Pre-aggregated sales per (grain, bucket, inventory, product), maintained
+-- incrementally on every transaction and rebuildable from history.
+create table if not exists sales_rollup (
+  "rollupKey" text primary key,
+  grain text not null,
+  bucket timestamptz not null,
+  "inventoryId" text,
+  "productId" text not null,
+  quantity bigint not null default 0,
+  revenue numeric not null default 0
+);
+create index if not exists sales_rollup_grain_inventory_bucket
+  on sales_rollup (grain, "inventoryId", bucket);
+
+-- Adds each row's quantity/revenue to its bucket in one atomic statement.
+create or replace function apply_sales_rollups(p_rows jsonb) returns void
+language sql as $$
+  insert into sales_rollup ("rollupKey", grain, bucket, "inventoryId", "productId", quantity, revenue)
+  select r->>'rollupKey', r->>'grain', (r->>'bucket')::timestamptz, r->>'inventoryId',
+         r->>'productId', (r->>'quantity')::bigint, (r->>'revenue')::numeric
+  from jsonb_array_elements(p_rows) r
+  on conflict ("rollupKey") do update
+    set quantity = sales_rollup.quantity + excluded.quantity,
+        revenue = sales_rollup.revenue + excluded.revenue;
+$$;
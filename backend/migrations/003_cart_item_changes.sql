@@ -0,0 +1,35 @@
+-- One line per (cart, product) so a quantity change is a single upsert.
+create unique index if not exists cart_items_cart_product on cart_items ("cartId", "productId");
+
+-- Applies [{productId, delta}] to a cart atomically: deltas for the same
+-- product are summed, lines are created or incremented in one statement,
+-- and lines that reach zero are removed. Returns every touched line.
+create or replace function cart_apply_changes(p_cart_id uuid, p_changes jsonb)
+returns setof cart_items language plpgsql as $$
+begin
+  return query
+  insert into cart_items ("cartId", "productId", quantity)
+  select p_cart_id, c->>'productId', sum((c->>'delta')::int)
+  from jsonb_array_elements(p_changes) c
+  group by c->>'productId'
+  on conflict ("cartId", "productId")
+    do update set quantity = cart_items.quantity + excluded.quantity
+  returning *;
+
+  delete from cart_items where "cartId" = p_cart_id and quantity <= 0;
+end $$;
+
+-- Takes one unit off a line, deleting it at zero. Returns the line as it
+-- was updated or deleted, or nothing if it does not exist.
+create or replace function cart_item_decrement(p_item_id bigint)
+returns setof cart_items language plpgsql as $$
+begin
+  return query
+  update cart_items set quantity = quantity - 1
+  where id = p_item_id and quantity > 1
+  returning *;
+
+  if not found then
+    return query delete from cart_items where id = p_item_id returning *;
+  end if;
+end $$;
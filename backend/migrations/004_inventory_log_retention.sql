@@ -0,0 +1,8 @@
+-- Keyset paging per inventory and retention sweeps by age.
+create index if not exists inventory_log_inventory_timestamp
+  on inventory_log ("inventoryId", timestamp desc, id desc);
+create index if not exists inventory_log_timestamp on inventory_log (timestamp, id);
+
+-- Rows moved out of inventory_log by `flask logs apply-retention`.
+create table if not exists inventory_log_archive (like inventory_log including defaults);
+alter table inventory_log_archive add column if not exists archived_at timestamptz default now();
@@ -0,0 +1,14 @@
+-- Change tracking for delta sync: every product write bumps updated_at and
+-- every delete leaves a tombstone.
+alter table product add column if not exists updated_at timestamptz default now();
+update product set updated_at = coalesce(updated_at, created_at, now());
+create index if not exists product_inventory_updated
+  on product ("inventoryId", updated_at, "productId");
+
+create table if not exists product_tombstone (
+  "productId" text primary key,
+  "inventoryId" text,
+  deleted_at timestamptz not null default now()
+);
+create index if not exists product_tombstone_inventory_deleted
+  on product_tombstone ("inventoryId", deleted_at, "productId");
@@ -0,0 +1,69 @@
+-- Checks out a cart in one transaction: stock is decremented in place for
+-- every line (null stock is left untracked), the sale is recorded at the
+-- prices read by that same update, and the cart and its lines are removed.
+-- The cart row is locked first, so a second checkout of the same cart waits
+-- and then finds nothing.
+--
+-- Returns {"transaction": row, "products": [updated rows]}, or
+-- {"error": "not_found" | "empty" | "missing", ...} without writing anything.
+create or replace function checkout_cart(p_cart_id uuid, p_owner_id text, p_user_id text)
+returns jsonb language plpgsql as $$
+declare
+  v_lines jsonb;
+  v_missing jsonb;
+  v_sold jsonb;
+  v_total numeric;
+  v_inventory product."inventoryId"%type;
+  v_transaction transactions;
+begin
+  perform 1 from cart where id = p_cart_id and "ownerUserId" = p_owner_id for update;
+  if not found then
+    return jsonb_build_object('error', 'not_found');
+  end if;
+
+  select jsonb_object_agg("productId", quantity) into v_lines
+  from (
+    select "productId", sum(quantity)::int as quantity
+    from cart_items where "cartId" = p_cart_id group by "productId"
+  ) l;
+  if v_lines is null then
+    return jsonb_build_object('error', 'empty');
+  end if;
+
+  select jsonb_agg(k) into v_missing
+  from jsonb_object_keys(v_lines) k
+  where not exists (select 1 from product p where p."productId" = k);
+  if v_missing is not null then
+    return jsonb_build_object('error', 'missing', 'productIds', v_missing);
+  end if;
+
+  with sold as (
+    update product p
+    set stock = case when p.stock is null then null else greatest(p.stock - (v_lines->>p."productId")::int, 0) end,
+        updated_at = now()
+    where p."productId" in (select jsonb_object_keys(v_lines))
+    returning p.*
+  )
+  select
+    jsonb_agg(to_jsonb(sold) order by "productId"),
+    sum(price * (v_lines->>"productId")::int),
+    (array_agg("inventoryId" order by "productId"))[1]
+  into v_sold, v_total, v_inventory
+  from sold;
+
+  insert into transactions ("lineItems", total, "userId", "inventoryId")
+  select
+    jsonb_agg(jsonb_build_object(
+      'productId', s->>'productId',
+      'quantity', (v_lines->>(s->>'productId'))::int,
+      'unitPrice', (s->>'price')::numeric
+    ) order by s->>'productId'),
+    v_total, p_user_id, v_inventory
+  from jsonb_array_elements(v_sold) s
+  returning * into v_transaction;
+
+  delete from cart_items where "cartId" = p_cart_id;
+  delete from cart where id = p_cart_id;
+
+  return jsonb_build_object('transaction', to_jsonb(v_transaction), 'products', v_sold);
+end $$;
@@ -0,0 +1,29 @@
+-- Item writes are limited to the caller's carts in the same statement, so
+-- the API does not have to look up an item's cart before changing it.
+drop function if exists cart_item_decrement(bigint);
+
+-- Takes one unit off a line in one of p_cart_ids, deleting it at zero.
+-- Returns the line as it was updated or deleted, or nothing if no such
+-- line exists in those carts.
+create or replace function cart_item_decrement(p_item_id bigint, p_cart_ids uuid[])
+returns setof cart_items language plpgsql as $$
+begin
+  return query
+  update cart_items set quantity = quantity - 1
+  where id = p_item_id and "cartId" = any(p_cart_ids) and quantity > 1
+  returning *;
+
+  if not found then
+    return query
+    delete from cart_items where id = p_item_id and "cartId" = any(p_cart_ids)
+    returning *;
+  end if;
+end $$;
+
+-- Sets a line's quantity if it is in one of p_cart_ids; returns the line.
+create or replace function cart_item_set_quantity(p_item_id bigint, p_cart_ids uuid[], p_quantity int)
+returns setof cart_items language sql as $$
+  update cart_items set quantity = p_quantity
+  where id = p_item_id and "cartId" = any(p_cart_ids)
+  returning *;
+$$;
@@ -1,15 +1,104 @@
+import io
+import os
+import math
+import csv
+import json
 import uuid
-from flask import Blueprint, request, jsonify
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 import supabase
-from helpers import create_record, get_records, update_record, delete_record
+from helpers import conditional_json, get_current_user, serialize, create_record, get_records, get_page, encode_cursor, decode_cursor, load_by_keys, update_record, upsert_records, delete_record
+from cache import TTLCache
+from events import get_broker
+from search import get_index, search_products
+from access import inventory_access_error
+import metrics
 
 products_bp = Blueprint("products_bp", __name__)
 
+# -------------------------
+# Change events
+# -------------------------
+# Every product write is published on "products:<inventoryId>" for the SSE
+# stream below; with ALTAR_BROKER_URL set this reaches every worker.
+EVENT_QUEUE_SIZE = 1000
+KEEPALIVE_SECONDS = 15
+# Each open stream holds one of the worker's request threads for as long
+# as it lasts, so only this many may be open per worker at a time; the
+# rest are answered 503 and should poll /changes. Defaults to half of
+# ALTAR_THREADS, leaving the other half for ordinary requests.
+MAX_STREAMS = int(os.environ.get("ALTAR_SSE_MAX_STREAMS", 0)) or max(1, int(os.environ.get("ALTAR_THREADS", 4)) // 2)
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+def limit_streams(n):
+    """Set MAX_STREAMS, e.g. from the server's thread count before it forks."""
+    global MAX_STREAMS, _stream_slots
+    MAX_STREAMS = max(1, n)
+    _stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+def publish_product_events(event, rows):
+    broker = get_broker()
+    for row in rows:
+        broker.publish(f"products:{row.get('inventoryId')}", {"event": event, "product": row})
+
+# -------------------------
+# Catalog cache
+# -------------------------
+# (rows, (body, etag)) keyed by ("inventory", inventoryId) and ("product",
+# productId), so repeat reads skip both the query and serialization.
+# Writes drop the keys they touched here at once, then publish them so
+# every other worker drops them too.
+CATALOG_CHANNEL = "catalog"
+catalog_cache = TTLCache(
+    maxsize=int(os.environ.get("CATALOG_CACHE_SIZE", 512)),
+    ttl=int(os.environ.get("CATALOG_CACHE_TTL", 60)),
+)
+
+metrics.register_gauge("altar_catalog_cache", "Product catalog cache counters", "stat", lambda: catalog_cache.stats())
+
+# Bumped on every invalidation, so a load that raced one is not cached
+_generations = {}
+_generations_lock = threading.Lock()
+
+def _fill(key, load):
+    generation = _generations.get(key)
+    cached = load()
+    with _generations_lock:
+        if cached is not None and _generations.get(key) == generation:
+            catalog_cache.set(key, cached)
+    return cached
+
+def _drop_cached(message):
+    keys = [("inventory", i) for i in message.get("inventoryIds", [])]
+    keys += [("product", p) for p in message.get("productIds", [])]
+    with _generations_lock:
+        for key in keys:
+            _generations[key] = _generations.get(key, 0) + 1
+            catalog_cache.pop(key)
+
+get_broker().subscribe(CATALOG_CHANNEL, _drop_cached)
+
+def invalidate_products(rows):
+    """Drop cached catalog entries for these product rows in every worker."""
+    if rows:
+        message = {
+            "inventoryIds": sorted({str(r.get("inventoryId")) for r in rows}),
+            "productIds": [str(r.get("productId")) for r in rows],
+        }
+        # Locally first: a broker may deliver our own message only later
+        _drop_cached(message)
+        get_broker().publish(CATALOG_CHANNEL, message)
+
 @products_bp.route("/", methods=["POST"])
 def create_product():
     data = request.json
     if not data.get("name") or data.get("price") is None:
         return jsonify({"error": "Missing product details"}), 400
+    denied = inventory_access_error(data.get("inventoryId"))
+    if denied:
+        return denied
     
     generated_id = str(uuid.uuid4())
     
@@ -21,33 +110,102 @@ def create_product():
         "stock": data.get("stock"),
         "inventoryId": data.get("inventoryId"),
         "price": data["price"],
-        "created_at": "now()"
+        "created_at": "now()",
+        "updated_at": "now()"
     }
     
     res = create_record("product", new_record)
+    invalidate_products(res.data)
+    publish_product_events("created", res.data)
     
     # Return the first item of the created record so the frontend can display it
     if res.data:
         return jsonify(res.data[0]), 201
     return jsonify({"error": "Failed to create record"}), 500
 
+# -------------------------
+# Typeahead search
+# -------------------------
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+@products_bp.route("/search", methods=["GET"])
+def search():
+    """Products in an inventory whose name or description words start with
+    the words of `q`. Served from an in-process index (see search.py) that
+    the product write routes keep current through their change events."""
+    inventory_id = request.args.get("inventoryId")
+    if not inventory_id:
+        return jsonify({"error": "Missing inventoryId"}), 400
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    try:
+        limit = min(int(request.args.get("limit", SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit"}), 400
+    return jsonify({"products": search_products(inventory_id, request.args.get("q", ""), limit)}), 200
+
+def _cached_product(product_id):
+    """(row, (body, etag)) for a product, or None if it does not exist."""
+    cached = catalog_cache.get(("product", product_id))
+    if cached is None:
+        def load():
+            res = get_records("product", {"productId": product_id})
+            return (res.data[0], serialize({"product": res.data[0]})) if res.data else None
+        cached = _fill(("product", product_id), load)
+    return cached
+
+def _product_access(product_id):
+    """(cached product, None) if the caller may use it, else (None, error response)."""
+    # Signed in first, so anonymous callers cannot probe ids or cost a read
+    if not get_current_user():
+        return None, (jsonify({"error": "Unauthorized"}), 401)
+    # The (usually cached) row tells us the inventory to check
+    cached = _cached_product(product_id)
+    if cached is None:
+        return None, (jsonify({"error": "Product not found"}), 404)
+    denied = inventory_access_error(cached[0].get("inventoryId"))
+    return (None, denied) if denied else (cached, None)
+
 @products_bp.route("/<product_id>", methods=["GET"])
 def get_product(product_id):
-    res = get_records("product", {"productId": product_id})
-    if not res.data:
-        return jsonify({"error": "Product not found"}), 404
-    return jsonify({"product": res.data[0]}), 200
+    cached, denied = _product_access(product_id)
+    if denied:
+        return denied
+    return conditional_json(serialized=cached[1])
+
+def _cache_inventory(inventory_id):
+    def load():
+        products = get_records("product", {"inventoryId": inventory_id}).data
+        # each product should contain 'id' (the UUID)
+        return (products, serialize({"products": products}))
+    return _fill(("inventory", inventory_id), load)
+
+def warm_catalog(inventory_ids):
+    """Preload inventories into the catalog cache and search index, e.g. in
+    the server process before it forks workers. Needs an app context."""
+    for inventory_id in inventory_ids:
+        _cache_inventory(str(inventory_id))
+        get_index(inventory_id)
 
 # Get product by inventory ID
 @products_bp.route("/inventory/<inventory_id>", methods=["GET"])
 def get_products_by_inventory(inventory_id):
-    res = get_records("product", {"inventoryId": inventory_id})
-    # res.data[0] should contain 'id' (the UUID)
-    return jsonify({"products": res.data}), 200
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    cached = catalog_cache.get(("inventory", inventory_id)) or _cache_inventory(inventory_id)
+    return conditional_json(serialized=cached[1])
 
 @products_bp.route("/<product_id>", methods=["PUT"])
 def update_product(product_id):
     data = request.json
+    _, denied = _product_access(product_id)
+    if denied:
+        return denied
 
     update_data = {}
     if "name" in data:
@@ -61,8 +219,11 @@ def update_product(product_id):
 
     if not update_data:
         return jsonify({"error": "No valid fields provided"}), 400
+    update_data["updated_at"] = "now()"
 
     res = update_record("product", "productId", product_id, update_data)
+    invalidate_products(res.data)
+    publish_product_events("updated", res.data)
 
     if not res.data:
         return jsonify({"error": "Product not found"}), 404
@@ -71,7 +232,367 @@ def update_product(product_id):
 
 @products_bp.route("/<product_id>", methods=["DELETE"])
 def delete_product(product_id):
+    _, denied = _product_access(product_id)
+    if denied:
+        return denied
     res = delete_record("product", "productId", product_id)
-    
+    if not res.data:
+        return jsonify({"error": "Product not found"}), 404
+    # Leave a tombstone so syncing terminals learn about the delete
+    upsert_records("product_tombstone", [
+        {"productId": p["productId"], "inventoryId": p.get("inventoryId"), "deleted_at": "now()"}
+        for p in res.data
+    ], on_conflict="productId")
+    invalidate_products(res.data)
+    publish_product_events("deleted", res.data)
+    return jsonify({"message": "Product deleted successfully"}), 200
+
+# -------------------------
+# Bulk import / export
+# -------------------------
+IMPORT_BATCH_SIZE = int(os.environ.get("PRODUCT_IMPORT_BATCH_SIZE", 1000))
+EXPORT_PAGE_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_FIELDS = ("productId", "name", "description", "price", "stock", "created_at", "updated_at")
+
+def _import_format():
+    fmt = request.args.get("format") or {
+        "text/csv": "csv",
+        "application/x-ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+    }.get(request.mimetype)
+    return fmt if fmt in ("csv", "ndjson") else None
+
+def _read_rows(fmt):
+    """Yield (row number, dict or error string) from the request body, one line at a time."""
+    text = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for n, raw in enumerate(csv.DictReader(text), start=1):
+            yield n, raw
+        return
+    n = 0
+    for line in text:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            yield n, "Invalid JSON"
+            continue
+        yield n, raw if isinstance(raw, dict) else "Expected a JSON object"
+
+def _import_row(raw, inventory_id):
+    """(product row, None) for a valid import row, else (None, error)."""
+    name = raw.get("name")
+    if name is not None and not isinstance(name, str):
+        return None, "name must be a string"
+    name = (name or "").strip()
+    if not name:
+        return None, "Missing name"
+    description = raw.get("description")
+    if description is not None and not isinstance(description, str):
+        return None, "description must be a string"
+    try:
+        price = float(raw.get("price"))
+    except (TypeError, ValueError):
+        return None, "Invalid price"
+    if not math.isfinite(price):
+        return None, "Invalid price"
+    stock = raw.get("stock")
+    if stock in (None, ""):
+        stock = None
+    else:
+        try:
+            stock = int(stock)
+        except (TypeError, ValueError):
+            return None, "Invalid stock"
+    if price < 0 or (stock is not None and stock < 0):
+        return None, "Price and stock cannot be negative"
+    product_id = raw.get("productId")
+    if product_id is not None and not isinstance(product_id, str):
+        return None, "productId must be a string"
+    return {
+        "productId": product_id or None,
+        "name": name,
+        "description": description or None,
+        "stock": stock,
+        "inventoryId": inventory_id,
+        "price": price,
+        "updated_at": "now()",
+    }, None
+
+def _write_import_batch(batch, inventory_id):
+    """Insert new products and upsert ones that name an existing productId.
+
+    Returns {row number: error} for rows that could not be written.
+    """
+    errors = {}
+    given, seen = [], set()
+    for n, row in batch:
+        if not row["productId"]:
+            continue
+        if row["productId"] in seen:
+            # One upsert statement cannot touch the same row twice
+            errors[n] = "Duplicate productId in import batch"
+            continue
+        seen.add(row["productId"])
+        given.append((n, row))
+    existing = load_by_keys("product", "productId", [row["productId"] for _, row in given])
+    updates, inserts = [], []
+    for n, row in given:
+        current = existing.get(row["productId"])
+        if current is None:
+            # A new productId is created like any other new row, so it gets
+            # the created_at the export pages on
+            inserts.append((n, {**row, "created_at": "now()"}))
+        elif str(current.get("inventoryId")) != str(inventory_id):
+            errors[n] = "productId belongs to another inventory"
+        else:
+            updates.append((n, row))
+    inserts += [
+        (n, {**row, "productId": str(uuid.uuid4()), "created_at": "now()"})
+        for n, row in batch if not row["productId"]
+    ]
+
+    for event, rows, write in (
+        ("created", inserts, lambda payload: create_record("product", payload)),
+        ("updated", updates, lambda payload: upsert_records("product", payload, on_conflict="productId")),
+    ):
+        if not rows:
+            continue
+        try:
+            res = write([row for _, row in rows])
+        except Exception as e:
+            for n, _ in rows:
+                errors[n] = f"Write failed: {str(e)}"
+            continue
+        invalidate_products(res.data)
+        publish_product_events(event, res.data)
+    return errors
+
+@products_bp.route("/inventory/<inventory_id>/import", methods=["POST"])
+def import_products(inventory_id):
+    """Bulk-load products from a CSV (with a header row) or NDJSON body.
+
+    Columns: name, price, and optionally description, stock and productId
+    (rows naming an existing productId update it). The body is read one
+    row at a time and written in batches of IMPORT_BATCH_SIZE, so memory
+    stays flat however large the catalog. Invalid rows are skipped and
+    reported by row number.
+    """
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    fmt = _import_format()
+    if fmt is None:
+        return jsonify({"error": "Send text/csv or application/x-ndjson, or pass format=csv|ndjson"}), 415
+
+    imported, failed, errors = 0, 0, []
+
+    def report(n, error):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": n, "error": error})
+
+    def flush(batch):
+        nonlocal imported
+        batch_errors = _write_import_batch(batch, inventory_id)
+        imported += len(batch) - len(batch_errors)
+        for n, error in sorted(batch_errors.items()):
+            report(n, error)
+
+    batch = []
+    try:
+        for n, raw in _read_rows(fmt):
+            row, error = (None, raw) if isinstance(raw, str) else _import_row(raw, inventory_id)
+            if error:
+                report(n, error)
+                continue
+            batch.append((n, row))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({
+            "error": f"Could not read import body: {str(e)}",
+            "imported": imported, "failed": failed, "errors": errors,
+        }), 400
+
+    return jsonify({"imported": imported, "failed": failed, "errors": errors}), 200
+
+def _export_rows(inventory_id):
+    # One page in memory at a time, oldest first
+    cursor = None
+    while True:
+        rows, cursor = get_page(
+            "product", {"inventoryId": inventory_id}, ("created_at", "productId"),
+            cursor, EXPORT_PAGE_SIZE, descending=False,
+        )
+        yield from rows
+        if not cursor:
+            return
+
+def _export_csv(inventory_id):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in _export_rows(inventory_id):
+        writer.writerow(row)
+        if out.tell() >= 64 * 1024:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+def _export_ndjson(inventory_id):
+    for row in _export_rows(inventory_id):
+        yield current_app.json.dumps(row) + "\n"
+
+@products_bp.route("/inventory/<inventory_id>/export", methods=["GET"])
+def export_products(inventory_id):
+    """Stream every product in an inventory as CSV (default) or format=ndjson.
+
+    The CSV uses the same columns the import accepts, so an export can be
+    edited and imported back."""
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    body, mimetype = (
+        (_export_csv(inventory_id), "text/csv") if fmt == "csv"
+        else (_export_ndjson(inventory_id), "application/x-ndjson")
+    )
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="inventory-{inventory_id}-products.{fmt}"'},
+    )
+
+# -------------------------
+# Delta sync
+# -------------------------
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+# updated_at/deleted_at are set from now(), the time a write's transaction
+# started, so rows do not become visible in timestamp order. Polls only
+# return rows older than this many seconds, which must cover the longest
+# product write plus any clock skew between this server and the database.
+SYNC_SAFETY_SECONDS = float(os.environ.get("PRODUCT_SYNC_SAFETY_SECONDS", 5))
+
+@products_bp.route("/inventory/<inventory_id>/changes", methods=["GET"])
+def get_product_changes(inventory_id):
+    """Products created, updated or deleted since `cursor`.
+
+    Without a cursor every product is returned. Keep the returned cursor
+    and send it back on the next poll; while hasMore is true, poll again
+    straight away. Changes show up here SYNC_SAFETY_SECONDS after they are
+    made (the SSE stream delivers them live).
+    """
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    try:
+        limit = min(int(request.args.get("limit", SYNC_PAGE_SIZE)), MAX_SYNC_PAGE_SIZE)
+        # The sync cursor pairs a product position with a tombstone position
+        after_changed, after_deleted = (
+            decode_cursor(request.args["cursor"], nested=True) if request.args.get("cursor") else (None, None)
+        )
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    filters = {"inventoryId": inventory_id}
+    # The cursor never passes this point, so a write that commits late is
+    # still ahead of it when it becomes visible
+    until = (datetime.now(timezone.utc) - timedelta(seconds=SYNC_SAFETY_SECONDS)).isoformat()
+    changed, _ = get_page(
+        "product", filters, ("updated_at", "productId"),
+        encode_cursor(after_changed) if after_changed else None, limit, until=until, descending=False,
+    )
+    deleted = []
+    if after_changed or after_deleted:
+        deleted, _ = get_page(
+            "product_tombstone", filters, ("deleted_at", "productId"),
+            encode_cursor(after_deleted) if after_deleted else None, limit, until=until, descending=False,
+        )
+
+    if changed:
+        after_changed = [changed[-1]["updated_at"], changed[-1]["productId"]]
+    if deleted:
+        after_deleted = [deleted[-1]["deleted_at"], deleted[-1]["productId"]]
+    elif not after_deleted:
+        # A full sync has nothing to delete; start tombstones from now on
+        latest, _ = get_page("product_tombstone", filters, ("deleted_at", "productId"), None, 1, until=until)
+        if latest:
+            after_deleted = [latest[0]["deleted_at"], latest[0]["productId"]]
+
+    return jsonify({
+        "changed": changed,
+        "deleted": [t["productId"] for t in deleted],
+        "cursor": encode_cursor([after_changed, after_deleted]),
+        "hasMore": len(changed) == limit or len(deleted) == limit,
+    }), 200
+
+# -------------------------
+# Live change stream
+# -------------------------
+@products_bp.route("/inventory/<inventory_id>/events", methods=["GET"])
+def stream_product_events(inventory_id):
+    """Server-sent events for product changes in one inventory.
+
+    Emits `created`, `updated` and `deleted` events with the product row
+    as data. A client that falls too far behind gets a `resync` event and
+    should catch up through the /changes endpoint. When this worker already
+    has MAX_STREAMS open the answer is 503 with Retry-After.
+    """
+    denied = inventory_access_error(inventory_id)
+    if denied:
+        return denied
+    slots = _stream_slots
+    if not slots.acquire(blocking=False):
+        return jsonify({"error": "Too many open event streams; poll /changes instead"}), 503, {"Retry-After": "30"}
+
+    def stream():
+        events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        overflowed = []
+
+        def on_message(message):
+            try:
+                events.put_nowait(message)
+            except queue.Full:
+                overflowed.append(True)
 
+        unsubscribe = get_broker().subscribe(f"products:{inventory_id}", on_message)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if overflowed:
+                    overflowed.clear()
+                    while not events.empty():
+                        events.get_nowait()
+                    yield "event: resync\ndata: {}\n\n"
+                try:
+                    message = events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['product'], default=str)}\n\n"
+        finally:
+            unsubscribe()
 
+    response = Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # The server closes the response when the client goes away, even if
+    # the stream was never started
+    response.call_on_close(slots.release)
+    return response
@@ -0,0 +1,153 @@
+import click
+from datetime import datetime, timezone
+from flask import Blueprint, request, jsonify
+from helpers import fan_out, get_current_user, get_page, call_rpc, delete_record
+from storage import memory_rpc
+from access import get_membership, inventory_access_error
+
+reports_bp = Blueprint("reports", __name__)
+
+GRAINS = ("hour", "day")
+ROLLUP_ORDER = ("bucket", "rollupKey")
+GROUPS = {"product": "productId", "bucket": "bucket", "inventory": "inventoryId"}
+
+# -------------------------
+# Rollup maintenance
+# -------------------------
+# sales_rollup holds one row per (grain, bucket, inventory, product) with the
+# quantity sold and revenue; buckets are UTC hours and days.
+def _bucket(created_at, grain):
+    ts = datetime.fromisoformat(str(created_at))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if grain == "day":
+        ts = ts.replace(hour=0)
+    return ts.isoformat()
+
+def rollup_rows(transactions):
+    """Fold transactions into per-bucket deltas for apply_sales_rollups."""
+    rows = {}
+    for t in transactions:
+        inventory_id = str(t["inventoryId"]) if t.get("inventoryId") is not None else None
+        # Rows not yet converted by backfill-line-items count units but no revenue
+        items = t.get("lineItems") or [
+            {"productId": pid, "quantity": 1, "unitPrice": None} for pid in t.get("productIds") or []
+        ]
+        for item in items:
+            for grain in GRAINS:
+                bucket = _bucket(t["created_at"], grain)
+                key = f"{grain}|{bucket}|{inventory_id}|{item['productId']}"
+                row = rows.setdefault(key, {
+                    "rollupKey": key, "grain": grain, "bucket": bucket,
+                    "inventoryId": inventory_id, "productId": item["productId"],
+                    "quantity": 0, "revenue": 0.0,
+                })
+                row["quantity"] += item["quantity"]
+                row["revenue"] += float(item.get("unitPrice") or 0) * item["quantity"]
+    return list(rows.values())
+
+def record_sale(transaction):
+    """Add a new transaction to the rollups; a failure here never fails the sale."""
+    try:
+        call_rpc("apply_sales_rollups", {"p_rows": rollup_rows([transaction])})
+    except Exception as e:
+        print(f"Rollup update failed for transaction {transaction.get('transactionId')}: {str(e)}")
+
+@memory_rpc("apply_sales_rollups")
+def _apply_sales_rollups(storage, params):
+    for delta in params["p_rows"]:
+        existing = storage.select("sales_rollup", {"rollupKey": delta["rollupKey"]}).data
+        if existing:
+            storage.update("sales_rollup", "rollupKey", delta["rollupKey"], {
+                "quantity": existing[0]["quantity"] + delta["quantity"],
+                "revenue": existing[0]["revenue"] + delta["revenue"],
+            })
+        else:
+            storage.insert("sales_rollup", delta)
+    return []
+
+@reports_bp.cli.command("rebuild-rollups")
+@click.option("--batch-size", default=500, show_default=True)
+def rebuild_rollups(batch_size):
+    """Recompute every rollup from the transaction history.
+
+    Run this with the app stopped. Rollups are deleted and then replayed,
+    and a sale recorded meanwhile would be counted twice or not at all.
+    """
+    for grain in GRAINS:
+        delete_record("sales_rollup", "grain", grain)
+    cursor, seen = None, 0
+    while True:
+        rows, cursor = get_page("transactions", None, ("created_at", "transactionId"), cursor, batch_size, descending=False)
+        deltas = rollup_rows(rows)
+        if deltas:
+            call_rpc("apply_sales_rollups", {"p_rows": deltas})
+        seen += len(rows)
+        click.echo(f"rolled up {seen} transactions")
+        if not cursor:
+            break
+
+# -------------------------
+# Reporting
+# -------------------------
+@reports_bp.route("/sales", methods=["GET"])
+def sales_report():
+    """Sales read from the rollups, never from raw transactions.
+
+    grain: hour|day (default day). inventoryId/productId narrow the rows and
+    since/until bound the bucket. group=product|bucket|inventory sums the
+    matching buckets; without it there is one row per bucket and product.
+    Only inventories the caller owns or collaborates on are reported.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if request.args.get("inventoryId"):
+        denied = inventory_access_error(request.args["inventoryId"])
+        if denied:
+            return denied
+        inventory_ids = [request.args["inventoryId"]]
+    else:
+        inventory_ids = sorted(get_membership(user.id).inventories)
+
+    grain = request.args.get("grain", "day")
+    group = request.args.get("group")
+    if grain not in GRAINS:
+        return jsonify({"error": "grain must be hour or day"}), 400
+    if group is not None and group not in GROUPS:
+        return jsonify({"error": "group must be product, bucket or inventory"}), 400
+
+    filters = {"grain": grain}
+    if request.args.get("productId"):
+        filters["productId"] = request.args["productId"]
+
+    def rollups(inventory_id):
+        rows, cursor = [], None
+        while True:
+            page, cursor = get_page(
+                "sales_rollup", {**filters, "inventoryId": str(inventory_id)}, ROLLUP_ORDER, cursor, 1000,
+                request.args.get("since"), request.args.get("until"), descending=False,
+            )
+            rows.extend(page)
+            if not cursor:
+                return rows
+
+    # One paged read per inventory, run concurrently
+    rows = [r for rows in fan_out(*(lambda i=i: rollups(i) for i in inventory_ids)) for r in rows]
+    rows.sort(key=lambda r: tuple(str(r.get(f)) for f in ROLLUP_ORDER))
+
+    if group:
+        key = GROUPS[group]
+        sums = {}
+        for r in rows:
+            total = sums.setdefault(r.get(key), {key: r.get(key), "quantity": 0, "revenue": 0.0})
+            total["quantity"] += r["quantity"]
+            total["revenue"] += float(r["revenue"])
+        sales = list(sums.values())
+    else:
+        sales = [
+            {f: r.get(f) for f in ("bucket", "inventoryId", "productId", "quantity", "revenue")}
+            for r in rows
+        ]
+    return jsonify({"grain": grain, "group": group, "sales": sales}), 200
@@ -0,0 +1,107 @@
+import os
+import gzip
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# -------------------------
+# JSON encoding
+# -------------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson.
+
+    Keys keep their insertion order (no sort), so rows from the datastore
+    serialize as-is. Types orjson does not know (Decimal, sets, ...) go
+    through the stdlib provider's default hook.
+    """
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return self.dumpb(obj).decode()
+
+    def dumpb(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj), mimetype=self.mimetype)
+
+# -------------------------
+# Response compression
+# -------------------------
+COMPRESS = os.environ.get("ALTAR_COMPRESS", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.environ.get("ALTAR_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("ALTAR_GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.environ.get("ALTAR_BROTLI_QUALITY", 4))
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html")
+# Suffix added to the ETag of each encoding, so caches keep them apart
+ENCODINGS = {"br": "-br", "gzip": "-gzip"}
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def compress(response):
+    """Gzip (or brotli, when installed and accepted) a buffered response body."""
+    response.vary.add("Accept-Encoding")
+    if (
+        not COMPRESS
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ENCODINGS[encoding], weak=weak)
+    return response
+
+def matching_etag(etag):
+    """The variant of `etag` (plain or per-encoding) named by If-None-Match, if any."""
+    for suffix in ("", *ENCODINGS.values()):
+        if request.if_none_match.contains(etag + suffix):
+            return etag + suffix
+    return None
+
+# -------------------------
+# Flask wiring
+# -------------------------
+def init_app(app):
+    """Encode JSON with orjson when it is installed and compress large
+    responses. ALTAR_FAST_JSON=0 keeps the stdlib encoder; ALTAR_COMPRESS=0
+    turns compression off."""
+    if orjson is not None and os.environ.get("ALTAR_FAST_JSON", "1") == "1":
+        app.json = OrjsonProvider(app)
+    app.after_request(compress)
@@ -0,0 +1,209 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import threading
+from collections import OrderedDict
+from helpers import get_records
+from events import get_broker
+import metrics
+
+# -------------------------
+# Product search index
+# -------------------------
+# One in-process index per inventory, built from the datastore on its
+# first search and then kept current from the "products:<inventoryId>"
+# change events that create/update/delete_product (and checkout) publish.
+MAX_INVENTORIES = int(os.environ.get("SEARCH_MAX_INVENTORIES", 256))
+# Rebuild from the datastore this often, in case a write bypassed the API
+INDEX_TTL = float(os.environ.get("SEARCH_INDEX_TTL", 600))
+FIELDS = ("name", "description")
+
+def tokenize(text):
+    return re.findall(r"\w+", (text or "").casefold())
+
+
+class ProductIndex:
+    """Token prefix index over the name and description of one inventory's products.
+
+    Every distinct token is kept in a sorted list, so a prefix lookup is a
+    bisect followed by a short scan. Each token maps to the ids of the
+    products containing it. Products are also kept sorted by name, so
+    broad matches (short prefixes) are ranked by walking that order
+    instead of sorting the whole match.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self._names = {}
+        self._by_name = []
+        self._postings = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def _tokens_of(self, row):
+        return {token for field in FIELDS for token in tokenize(row.get(field))}
+
+    def add(self, row):
+        product_id = row.get("productId")
+        with self._lock:
+            self._remove(product_id)
+            self.products[product_id] = row
+            self._names[product_id] = (row.get("name") or "").casefold()
+            bisect.insort(self._by_name, (self._names[product_id], product_id))
+            for token in self._tokens_of(row):
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    bisect.insort(self._tokens, token)
+                self._postings[token].add(product_id)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        row = self.products.pop(product_id, None)
+        if row is None:
+            return
+        name = self._names.pop(product_id)
+        del self._by_name[bisect.bisect_left(self._by_name, (name, product_id))]
+        for token in self._tokens_of(row):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(product_id)
+            if not ids:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _prefixed(self, prefix):
+        ids = set()
+        i = bisect.bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            ids |= self._postings[self._tokens[i]]
+            i += 1
+        return ids
+
+    def search(self, query, limit):
+        """Products where every query word prefixes some word of the name or
+        description; names starting with the query come first."""
+        words = tokenize(query)
+        if not words:
+            return []
+        with self._lock:
+            matched = None
+            # Narrowest (longest) word first keeps the intersections small
+            for word in sorted(words, key=len, reverse=True):
+                ids = self._prefixed(word)
+                matched = ids if matched is None else matched & ids
+                if not matched:
+                    return []
+            needle = query.strip().casefold()
+            # Walking the name order finds `limit` hits after about
+            # limit * total / matched steps; a heap costs about `matched`
+            if len(matched) ** 2 < limit * len(self._by_name):
+                names = self._names
+                best = heapq.nsmallest(
+                    limit, matched, key=lambda p: (not names[p].startswith(needle), names[p], p)
+                )
+            else:
+                best = self._walk_names(needle, matched, limit)
+            return [self.products[product_id] for product_id in best]
+
+    def _walk_names(self, needle, matched, limit):
+        # Names starting with the query are one contiguous run of _by_name
+        start = bisect.bisect_left(self._by_name, (needle,))
+        end = start
+        best = []
+        while end < len(self._by_name) and self._by_name[end][0].startswith(needle):
+            if self._by_name[end][1] in matched:
+                best.append(self._by_name[end][1])
+                if len(best) >= limit:
+                    return best
+            end += 1
+        for i, (_, product_id) in enumerate(self._by_name):
+            if len(best) >= limit:
+                break
+            if (i < start or i >= end) and product_id in matched:
+                best.append(product_id)
+        return best
+
+    def apply(self, message):
+        if message.get("event") == "deleted":
+            self.remove(message["product"].get("productId"))
+        else:
+            self.add(message["product"])
+
+
+class _Entry:
+    def __init__(self, inventory_id):
+        self.index = ProductIndex()
+        self.ready = threading.Event()
+        self.built_at = time.monotonic()
+        self._pending = []
+        self._lock = threading.Lock()
+        # Subscribe before loading so no write between the two is missed
+        self.unsubscribe = get_broker().subscribe(f"products:{inventory_id}", self._on_change)
+
+    def _on_change(self, message):
+        with self._lock:
+            if not self.ready.is_set():
+                self._pending.append(message)
+                return
+        self.index.apply(message)
+
+    def load(self, inventory_id):
+        try:
+            for row in get_records("product", {"inventoryId": inventory_id}).data:
+                self.index.add(row)
+        finally:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self.ready.set()
+        for message in pending:
+            self.index.apply(message)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_stats = {"builds": 0, "searches": 0}
+
+metrics.register_gauge(
+    "altar_search_index", "Product search index counters", "stat",
+    lambda: {**_stats, "inventories": len(_indexes)},
+)
+
+def get_index(inventory_id):
+    """The search index for an inventory, loading it on first use."""
+    inventory_id = str(inventory_id)
+    evicted = []
+    with _indexes_lock:
+        entry = _indexes.get(inventory_id)
+        if entry is not None and time.monotonic() - entry.built_at > INDEX_TTL:
+            evicted.append(_indexes.pop(inventory_id))
+            entry = None
+        build = entry is None
+        if build:
+            entry = _indexes[inventory_id] = _Entry(inventory_id)
+            _stats["builds"] += 1
+            while len(_indexes) > MAX_INVENTORIES:
+                evicted.append(_indexes.popitem(last=False)[1])
+        _indexes.move_to_end(inventory_id)
+    for old in evicted:
+        old.unsubscribe()
+    if build:
+        try:
+            entry.load(inventory_id)
+        except Exception:
+            with _indexes_lock:
+                if _indexes.get(inventory_id) is entry:
+                    del _indexes[inventory_id]
+            entry.unsubscribe()
+            raise
+    entry.ready.wait()
+    return entry.index
+
+def search_products(inventory_id, query, limit):
+    _stats["searches"] += 1
+    return get_index(inventory_id).search(query, limit)
@@ -0,0 +1,170 @@
+"""Production entry point: a preforked gunicorn server running create_app().
+
+    python serve.py --bind 0.0.0.0:8000
+    ALTAR_WORKERS=5 ALTAR_THREADS=8 python serve.py
+
+The app is built and warmed once in the master process: modules, routes,
+the Supabase storage backend, JWKS signing keys and, with
+ALTAR_WARM_INVENTORIES=1,2,3, those catalogs (cache and search index).
+Workers are then forked from it and share that memory copy-on-write.
+Each worker opens its own datastore client, broker connection, fan-out
+pool and log writers.
+
+Defaults: 2 x cores + 1 workers with 4 threads each. Run more than one
+worker with ALTAR_BROKER_URL set so cache invalidations reach them all.
+Only Supabase storage can be shared by several workers. With a memory
+or sqlite:/// store the server always runs one worker (threads only),
+and that worker opens the store itself after the fork.
+
+Each open /events (SSE) stream occupies a worker thread until the client
+disconnects. A worker accepts at most ALTAR_SSE_MAX_STREAMS of them
+(default: half its threads) and answers 503 beyond that, so the rest of
+its threads stay free for ordinary requests. Size for the terminals that
+stream: workers x ALTAR_SSE_MAX_STREAMS must cover them, e.g. 40
+terminals on 5 workers need ALTAR_SSE_MAX_STREAMS=8 and ALTAR_THREADS of
+about 12.
+
+Reloads go through gunicorn's signals. SIGHUP swaps in fresh workers
+gracefully, and in-flight requests finish within ALTAR_GRACEFUL_TIMEOUT.
+Because the app is preloaded, new code is not picked up on SIGHUP. To
+deploy new code, send SIGUSR2 to start a new master, then SIGTERM the old
+one. Without gunicorn installed this falls back to a single threaded
+process.
+
+ALTAR_WORKER_CLASS=gevent serves each request on a greenlet instead of a
+thread, so a worker holds up to ALTAR_CONNECTIONS (default 1000) requests
+and SSE streams at once while they wait on the datastore. Handlers stay
+synchronous: gevent patches sockets, threads and locks before the app is
+imported, so the pooled Supabase client, fan_out and the Redis broker
+yield instead of blocking. Needs `gevent`.
+"""
+import os
+import sys
+
+WORKER_CLASS = os.environ.get("ALTAR_WORKER_CLASS", "gthread")
+if WORKER_CLASS == "gevent":
+    # Before anything imports socket or threading: the app is preloaded
+    # here and the workers inherit these modules
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import helpers
+import log_writer
+from app import create_app
+from events import get_broker
+from products import limit_streams, warm_catalog
+from supabase_client import get_client
+
+# -------------------------
+# Sizing
+# -------------------------
+def cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+WORKERS = int(os.environ.get("ALTAR_WORKERS", 0)) or 2 * cores() + 1
+THREADS = int(os.environ.get("ALTAR_THREADS", 4))
+CONNECTIONS = int(os.environ.get("ALTAR_CONNECTIONS", 1000))
+BIND = os.environ.get("ALTAR_BIND", "0.0.0.0:8000")
+GRACEFUL_TIMEOUT = int(os.environ.get("ALTAR_GRACEFUL_TIMEOUT", 30))
+# Recycle workers after this many requests (0 = never), with jitter
+MAX_REQUESTS = int(os.environ.get("ALTAR_MAX_REQUESTS", 0))
+
+# -------------------------
+# Warm-up
+# -------------------------
+def shared_storage():
+    """True when workers can share the datastore. A memory or SQLite store
+    lives inside one process, so a second worker would diverge from it."""
+    return os.environ.get("ALTAR_STORAGE", "supabase") == "supabase"
+
+def warm(app):
+    """Load what every worker can share before forking."""
+    try:
+        helpers.warm_signing_keys()
+    except Exception as e:
+        print(f"Could not prefetch signing keys: {str(e)}")
+    if not shared_storage():
+        # Opened by the worker, so no SQLite connection crosses the fork
+        return
+    helpers.get_storage()
+    inventory_ids = [i for i in os.environ.get("ALTAR_WARM_INVENTORIES", "").split(",") if i.strip()]
+    if inventory_ids:
+        with app.app_context():
+            warm_catalog(i.strip() for i in inventory_ids)
+
+def post_fork(server, worker):
+    # Reconnect what the parent process owned; pooled clients are per-pid already
+    get_broker()
+    if shared_storage():
+        get_client()
+
+def worker_exit(server, worker):
+    log_writer.close_all()
+
+# -------------------------
+# Server
+# -------------------------
+def options(bind=BIND, workers=WORKERS, threads=THREADS):
+    return {
+        "bind": bind,
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gevent" if WORKER_CLASS == "gevent" else "gthread" if threads > 1 else "sync",
+        "worker_connections": CONNECTIONS,
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "keepalive": 5,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS // 10,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }
+
+def run(app, **kwargs):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        host, _, port = kwargs.get("bind", BIND).rpartition(":")
+        print("gunicorn is not installed; serving from one threaded process")
+        app.run(host=host or "0.0.0.0", port=int(port), threaded=True)
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options(**kwargs).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    if kwargs.get("workers", WORKERS) > 1 and not os.environ.get("ALTAR_BROKER_URL"):
+        print("ALTAR_BROKER_URL is not set; caches in one worker will not see writes made by another")
+    Server().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default=BIND)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("ALTAR_SSE_MAX_STREAMS"):
+        # A stream holds a thread under gthread, only a greenlet under gevent
+        limit_streams((CONNECTIONS if WORKER_CLASS == "gevent" else args.threads) // 2)
+    workers = args.workers
+    if workers > 1 and not shared_storage():
+        print(f"ALTAR_STORAGE={os.environ['ALTAR_STORAGE']} cannot be shared between workers; serving with one")
+        workers = 1
+    app = create_app()
+    warm(app)
+    run(app, bind=args.bind, workers=workers, threads=args.threads)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
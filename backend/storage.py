@@ -0,0 +1,299 @@
+import copy
+import json
+import uuid
+import sqlite3
+import threading
+import itertools
+from datetime import datetime, timezone
+
+# -------------------------
+# Storage backends
+# -------------------------
+# Every backend exposes the same primitives the helpers use and returns
+# objects with a `.data` list of row dicts, like a PostgREST response.
+
+class Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _quoted(value):
+    # A value inside a PostgREST or=(...) filter: double-quoted, with
+    # backslashes and quotes escaped so it cannot end the expression
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+class SupabaseStorage:
+    """Storage backed by the hosted Supabase (PostgREST) project."""
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+
+    @property
+    def client(self):
+        # Looked up per call so a forked worker gets its own pooled client
+        return self.client_factory()
+
+    def select(self, table, filters=None):
+        q = self.client.table(table).select("*")
+        for k, v in (filters or {}).items():
+            q = q.eq(k, v)
+        return q.execute()
+
+    def select_in(self, table, field, values, filters=None):
+        q = self.client.table(table).select("*").in_(field, list(values))
+        for k, v in (filters or {}).items():
+            q = q.eq(k, v)
+        return q.execute()
+
+    def select_page(self, table, filters=None, order_by=("created_at", "id"), after=None,
+                    limit=100, since=None, until=None, descending=True):
+        first, second = order_by
+        op = "lt" if descending else "gt"
+        q = self.client.table(table).select("*")
+        for k, v in (filters or {}).items():
+            q = q.eq(k, v)
+        if since is not None:
+            q = q.gte(first, since)
+        if until is not None:
+            q = q.lt(first, until)
+        if after is not None:
+            a1, a2 = (_quoted(a) for a in after)
+            q = q.or_(f'{first}.{op}.{a1},and({first}.eq.{a1},{second}.{op}.{a2})')
+        return q.order(first, desc=descending).order(second, desc=descending).limit(limit).execute()
+
+    def insert(self, table, payload):
+        return self.client.table(table).insert(payload).execute()
+
+    def upsert(self, table, rows, on_conflict):
+        return self.client.table(table).upsert(rows, on_conflict=on_conflict).execute()
+
+    def update(self, table, field, value, payload):
+        return self.client.table(table).update(payload).eq(field, value).execute()
+
+    def delete(self, table, field, value):
+        return self.client.table(table).delete().eq(field, value).execute()
+
+    def delete_in(self, table, field, values):
+        return self.client.table(table).delete().in_(field, list(values)).execute()
+
+    def rpc(self, name, params):
+        return self.client.rpc(name, params).execute()
+
+
+# Keys the hosted schema generates on insert: (column, kind)
+GENERATED_KEYS = {
+    "cart": ("id", "uuid"),
+    "cart_items": ("id", "serial"),
+    "inventory": ("inventoryId", "serial"),
+    "inventory_log": ("id", "serial"),
+    "inventory_users": ("id", "serial"),
+    "transactions": ("transactionId", "serial"),
+}
+
+# Timestamp columns the hosted schema defaults on insert (migrations/005);
+# rows stored before a column existed are backfilled from created_at
+DEFAULT_NOW = {
+    "product": ("updated_at",),
+}
+
+# Python stand-ins for the SQL functions in migrations/, keyed by name.
+# Each receives the MemoryStorage and the params, and runs under its lock.
+MEMORY_RPCS = {}
+
+def memory_rpc(name):
+    def register(fn):
+        MEMORY_RPCS[name] = fn
+        return fn
+    return register
+
+def _values(payload):
+    return {k: now_iso() if v == "now()" else v for k, v in payload.items()}
+
+def _ordered(value):
+    # Sort key that puts nulls after every value, as Postgres does ascending
+    return (value is None, value if value is not None else "")
+
+def _same(a, b):
+    # PostgREST compares query-string values as text, so "7" matches 7
+    return a == b or (a is not None and b is not None and str(a) == str(b))
+
+
+class MemoryStorage:
+    """In-process store with the same interface as SupabaseStorage.
+
+    Rows live in dicts guarded by one lock. With `path`, every write is
+    also persisted to a SQLite file that is reloaded on start, so the
+    same store can back a single-box offline kiosk.
+    """
+
+    def __init__(self, path=None):
+        self._tables = {}
+        self._serials = {}
+        self._rids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.path = path
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("CREATE TABLE IF NOT EXISTS rows (rid INTEGER PRIMARY KEY, tbl TEXT, doc TEXT)")
+            self._load()
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def _load(self):
+        last = 0
+        for rid, tbl, doc in self._db.execute("SELECT rid, tbl, doc FROM rows ORDER BY rid"):
+            row = json.loads(doc)
+            for column in DEFAULT_NOW.get(tbl, ()):
+                if row.get(column) is None:
+                    row[column] = row.get("created_at") or now_iso()
+            self._tables.setdefault(tbl, {})[rid] = row
+            key, kind = GENERATED_KEYS.get(tbl, (None, None))
+            if kind == "serial" and isinstance(row.get(key), int):
+                self._serials[tbl] = max(self._serials.get(tbl, 0), row[key])
+            last = rid
+        self._rids = itertools.count(last + 1)
+
+    def _save(self, tbl, rid, row):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO rows (rid, tbl, doc) VALUES (?, ?, ?)",
+                (rid, tbl, json.dumps(row, default=str)),
+            )
+
+    def _drop(self, rid):
+        if self._db is not None:
+            self._db.execute("DELETE FROM rows WHERE rid = ?", (rid,))
+
+    # -------------------------
+    # Internals
+    # -------------------------
+    def _rows(self, table):
+        return self._tables.setdefault(table, {})
+
+    def _match(self, table, filters):
+        filters = filters or {}
+        return [
+            (rid, row) for rid, row in self._rows(table).items()
+            if all(_same(row.get(k), v) for k, v in filters.items())
+        ]
+
+    def _new_row(self, table, payload):
+        row = _values(payload)
+        row.setdefault("created_at", now_iso())
+        for column in DEFAULT_NOW.get(table, ()):
+            if row.get(column) is None:
+                row[column] = row["created_at"]
+        key, kind = GENERATED_KEYS.get(table, (None, None))
+        if key and row.get(key) is None:
+            if kind == "uuid":
+                row[key] = str(uuid.uuid4())
+            else:
+                self._serials[table] = self._serials.get(table, 0) + 1
+                row[key] = self._serials[table]
+        rid = next(self._rids)
+        self._rows(table)[rid] = row
+        self._save(table, rid, row)
+        return row
+
+    # -------------------------
+    # Primitives
+    # -------------------------
+    def select(self, table, filters=None):
+        with self._lock:
+            return Result([copy.deepcopy(row) for _, row in self._match(table, filters)])
+
+    def select_in(self, table, field, values, filters=None):
+        values = list(values)
+        with self._lock:
+            return Result([
+                copy.deepcopy(row) for _, row in self._match(table, filters)
+                if any(_same(row.get(field), v) for v in values)
+            ])
+
+    def select_page(self, table, filters=None, order_by=("created_at", "id"), after=None,
+                    limit=100, since=None, until=None, descending=True):
+        first, second = order_by
+        key = lambda row: (_ordered(row.get(first)), _ordered(row.get(second)))
+        with self._lock:
+            rows = [row for _, row in self._match(table, filters)]
+        # As in SQL, a null never satisfies a range bound
+        if since is not None:
+            rows = [row for row in rows if row.get(first) is not None and row[first] >= since]
+        if until is not None:
+            rows = [row for row in rows if row.get(first) is not None and row[first] < until]
+        if after is not None:
+            after = tuple(_ordered(v) for v in after)
+            rows = [row for row in rows if (key(row) < after if descending else key(row) > after)]
+        rows.sort(key=key, reverse=descending)
+        return Result([copy.deepcopy(row) for row in rows[:limit]])
+
+    def insert(self, table, payload):
+        payloads = payload if isinstance(payload, list) else [payload]
+        with self._lock:
+            return Result([copy.deepcopy(self._new_row(table, p)) for p in payloads])
+
+    def upsert(self, table, rows, on_conflict):
+        out = []
+        with self._lock:
+            for payload in rows:
+                existing = self._match(table, {on_conflict: payload.get(on_conflict)})
+                if existing:
+                    rid, row = existing[0]
+                    row.update(_values(payload))
+                    self._save(table, rid, row)
+                else:
+                    row = self._new_row(table, payload)
+                out.append(copy.deepcopy(row))
+        return Result(out)
+
+    def update(self, table, field, value, payload):
+        out = []
+        with self._lock:
+            for rid, row in self._match(table, {field: value}):
+                row.update(_values(payload))
+                self._save(table, rid, row)
+                out.append(copy.deepcopy(row))
+        return Result(out)
+
+    def delete(self, table, field, value):
+        with self._lock:
+            matched = self._match(table, {field: value})
+            for rid, _ in matched:
+                del self._rows(table)[rid]
+                self._drop(rid)
+        return Result([row for _, row in matched])
+
+    def delete_in(self, table, field, values):
+        values = list(values)
+        with self._lock:
+            matched = [
+                (rid, row) for rid, row in self._rows(table).items()
+                if any(_same(row.get(field), v) for v in values)
+            ]
+            for rid, _ in matched:
+                del self._rows(table)[rid]
+                self._drop(rid)
+        return Result([row for _, row in matched])
+
+    def rpc(self, name, params):
+        with self._lock:
+            return Result(MEMORY_RPCS[name](self, params))
+
+
+def open_storage(spec, client_factory):
+    """Build a backend from ALTAR_STORAGE: "supabase", "memory" or "sqlite:///path.db"."""
+    if spec == "memory":
+        return MemoryStorage()
+    if spec.startswith("sqlite:///"):
+        return MemoryStorage(spec[len("sqlite:///"):])
+    if spec == "supabase":
+        return SupabaseStorage(client_factory)
+    raise ValueError(f"Unknown storage backend: {spec}")
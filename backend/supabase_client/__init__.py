@@ -1,10 +1 @@
-from supabase import create_client
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-supabase = create_client(
-    os.environ["SUPABASE_URL"],
-    os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-)
+from .client import get_client
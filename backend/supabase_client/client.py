@@ -1,17 +1,57 @@
 import os
-from supabase import create_client
+import threading
+import httpx
+from supabase import create_client, ClientOptions
 from dotenv import load_dotenv
 
 # Load environment variables once
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", 30))
+POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", 20))
+HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Supabase environment variables not set")
+_client = None
+_client_pid = None
+_lock = threading.Lock()
 
-supabase = create_client(
-    SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
-)
+def _http_client():
+    # One keep-alive pool for PostgREST, auth and storage; httpx.Client is thread-safe
+    return httpx.Client(
+        http2=HTTP2,
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=30,
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+
+def get_client():
+    """The process-wide Supabase client, created on first use.
+
+    A client inherited through fork is replaced, since its pooled
+    connections belong to the parent process.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            SUPABASE_URL = os.getenv("SUPABASE_URL")
+            SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+                raise RuntimeError("Supabase environment variables not set")
+
+            _client = create_client(
+                SUPABASE_URL,
+                SUPABASE_SERVICE_ROLE_KEY,
+                options=ClientOptions(
+                    httpx_client=_http_client(),
+                    postgrest_client_timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    # A server-side service client keeps no session to refresh
+                    auto_refresh_token=False,
+                    persist_session=False,
+                ),
+            )
+            _client_pid = os.getpid()
+    return _client
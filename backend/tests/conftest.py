@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend modules import each other by bare name, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ALTAR_STORAGE", "memory")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret-test-secret-test-secret!")
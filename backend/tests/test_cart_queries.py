@@ -0,0 +1,55 @@
+import time
+import jwt
+import pytest
+import helpers
+from access import get_membership
+from bench import LatencyStorage
+from storage import MemoryStorage
+
+USER = "cart-test-user"
+
+@pytest.fixture
+def store():
+    memory = MemoryStorage()
+    store = LatencyStorage(memory, 0)
+    helpers.set_storage(store)
+    yield store
+    helpers.set_storage(None)
+
+@pytest.fixture
+def client():
+    from app import create_app
+    return create_app().test_client()
+
+def auth_headers():
+    token = jwt.encode(
+        {"sub": USER, "aud": helpers.JWT_AUDIENCE, "exp": int(time.time()) + 3600},
+        helpers.JWT_SECRET,
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+def seed_cart(memory, lines):
+    inventory = memory.insert("inventory", {"name": "Store", "ownerUserId": USER}).data[0]
+    memory.insert("product", [
+        {"productId": f"p-{i}", "name": f"Item {i}", "price": 2.5, "stock": 10, "inventoryId": inventory["inventoryId"]}
+        for i in range(lines)
+    ])
+    cart = memory.insert("cart", {"ownerUserId": USER, "cartName": "test"}).data[0]
+    memory.insert("cart_items", [
+        {"cartId": cart["id"], "productId": f"p-{i}", "quantity": 1 + i % 3} for i in range(lines)
+    ])
+    return cart["id"]
+
+@pytest.mark.parametrize("lines", [1, 30])
+def test_cart_items_query_count_is_constant(store, client, lines):
+    cart_id = seed_cart(store.inner, lines)
+    # Load the membership cache up front; the count covers the route's own reads
+    get_membership(USER, refresh=True)
+
+    store.reset()
+    res = client.get(f"/api/cart/{cart_id}/items", headers=auth_headers())
+
+    assert res.status_code == 200
+    assert len(res.get_json()["items"]) == lines
+    # One read for the lines, one `in` query for all their products
+    assert store.calls == 2
@@ -1,8 +1,35 @@
-from flask import Blueprint, request, jsonify
-from helpers import get_current_user, get_records, create_record, update_record, delete_record
+import click
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from helpers import get_current_user, get_records, get_page, decode_cursor, valid_timestamp, load_by_keys, create_record, upsert_records, update_record, delete_record
+from reports import record_sale
 
 transactions_bp = Blueprint("transactions", __name__)
 
+# -------------------------
+# Line items
+# -------------------------
+# A transaction stores lineItems = [{productId, quantity, unitPrice}]; the
+# legacy productIds shape (one entry per unit) is derived from it on read.
+def to_line_items(productIds, prices):
+    counts = {}
+    for pid in productIds:
+        counts[pid] = counts.get(pid, 0) + 1
+    return [{"productId": pid, "quantity": qty, "unitPrice": prices.get(pid)} for pid, qty in counts.items()]
+
+def expand_product_ids(line_items):
+    return [item["productId"] for item in line_items for _ in range(item["quantity"])]
+
+def stored_prices(product_ids):
+    products = load_by_keys("product", "productId", product_ids)
+    return {pid: float(p["price"]) for pid, p in products.items() if p.get("price") is not None}
+
+def _valid_line_items(items):
+    return isinstance(items, list) and len(items) > 0 and all(
+        isinstance(i, dict) and i.get("productId")
+        and isinstance(i.get("quantity"), int) and i["quantity"] > 0
+        for i in items
+    )
+
 @transactions_bp.route("/create", methods=["POST"])
 def create_transaction():
     """Create a new transaction"""
@@ -12,6 +39,7 @@ def create_transaction():
             return jsonify({"error": "No JSON body provided"}), 400
 
         productIds = data.get("productIds", [])
+        lineItems = data.get("lineItems")
         total = data.get("total", 0)
         userId = data.get("userId")  # Allow userId to be passed explicitly
         inventoryId = data.get("inventoryId")
@@ -21,16 +49,33 @@ def create_transaction():
         if user and not userId:
             userId = user.id
 
-        if not productIds or not isinstance(productIds, list) or len(productIds) == 0:
+        if lineItems is not None:
+            if not _valid_line_items(lineItems):
+                return jsonify({"error": "Missing or invalid lineItems"}), 400
+            lineItems = [
+                {"productId": i["productId"], "quantity": i["quantity"], "unitPrice": i.get("unitPrice")}
+                for i in lineItems
+            ]
+        elif not productIds or not isinstance(productIds, list) or len(productIds) == 0:
             return jsonify({"error": "Missing or invalid productIds"}), 400
-        
+        else:
+            lineItems = to_line_items(productIds, {})
+
         if not total or total <= 0:
             return jsonify({"error": "Total must be greater than 0"}), 400
 
+        # Fill in unit prices the client did not send from the stored products
+        unpriced = [i["productId"] for i in lineItems if i["unitPrice"] is None]
+        if unpriced:
+            prices = stored_prices(unpriced)
+            for i in lineItems:
+                if i["unitPrice"] is None:
+                    i["unitPrice"] = prices.get(i["productId"])
+
         # Create transaction record in Supabase
         # Note: transactionId is auto-generated, created_at has default
         transaction_data = {
-            "productIds": productIds,
+            "lineItems": lineItems,
             "total": float(total),
             "userId": userId,
             "inventoryId": inventoryId,
@@ -40,15 +85,8 @@ def create_transaction():
         result = create_record("transactions", transaction_data)
         
         if result.data and len(result.data) > 0:
-            transaction = result.data[0]
-            return jsonify({
-                "transactionId": transaction.get("transactionId"),
-                "productIds": transaction.get("productIds"),
-                "total": transaction.get("total"),
-                "userId": transaction.get("userId"),
-                "inventoryId": transaction.get("inventoryId"),
-                "created_at": transaction.get("created_at"),
-            }), 201
+            record_sale(result.data[0])
+            return jsonify(_transaction_json(result.data[0])), 201
         else:
             print(f"No data in response: {result}")
             return jsonify({"error": "Failed to create transaction in database"}), 500
@@ -60,38 +98,70 @@ def create_transaction():
         return jsonify({"error": f"Transaction creation error: {str(e)}"}), 500
 
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Keyset order: newest first, transactionId breaks created_at ties
+ORDER = ("created_at", "transactionId")
+
+
+def _transaction_json(t):
+    # Rows go out as the datastore returned them; only the legacy productIds
+    # view is filled in from lineItems, in place
+    line_items = t.get("lineItems")
+    if line_items:
+        t["productIds"] = expand_product_ids(line_items)
+    return t
+
+
+def _stream_transactions(filters, since, until, cursor):
+    # One page in memory at a time, however many rows match
+    while True:
+        rows, cursor = get_page("transactions", filters, ORDER, cursor, MAX_PAGE_SIZE, since, until)
+        for t in rows:
+            yield current_app.json.dumps(_transaction_json(t)) + "\n"
+        if not cursor:
+            return
+
+
 @transactions_bp.route("/", methods=["GET"])
 def list_transactions():
-    """Get all transactions, optionally filtered by userId"""
+    """List transactions newest first, one page at a time.
+
+    Optional filters: userId, inventoryId, since/until (created_at range).
+    Pass the returned nextCursor back as `cursor` for the next page, or
+    format=ndjson to stream every matching transaction.
+    """
     try:
-        user_id = request.args.get("userId")
-        
+        filters = {f: request.args[f] for f in ("userId", "inventoryId") if request.args.get(f)}
+        since = request.args.get("since")
+        until = request.args.get("until")
+        cursor = request.args.get("cursor")
+
         try:
-            if user_id:
-                # Get transactions for specific user
-                result = get_records("transactions", {"userId": user_id})
-            else:
-                # Get all transactions
-                result = get_records("transactions", {})
-            
-            if result.data:
-                transactions = []
-                for t in result.data:
-                    transactions.append({
-                        "transactionId": t.get("transactionId"),
-                        "productIds": t.get("productIds"),
-                        "total": t.get("total"),
-                        "userId": t.get("userId"),
-                        "inventoryId": t.get("inventoryId"),
-                        "created_at": t.get("created_at"),
-                    })
-                return jsonify({"transactions": transactions}), 200
-            else:
-                return jsonify({"transactions": []}), 200
-        except Exception as query_err:
-            print(f"Database query error: {str(query_err)}")
-            # Return empty list if table doesn't exist
-            return jsonify({"transactions": []}), 200
+            limit = int(request.args.get("limit", PAGE_SIZE))
+            if cursor:
+                decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid limit or cursor"}), 400
+        if limit < 1:
+            return jsonify({"error": "Invalid limit or cursor"}), 400
+        if not valid_timestamp(since) or not valid_timestamp(until):
+            return jsonify({"error": "since and until must be ISO 8601 timestamps"}), 400
+
+        if request.args.get("format") == "ndjson":
+            return Response(
+                stream_with_context(_stream_transactions(filters, since, until, cursor)),
+                mimetype="application/x-ndjson",
+            )
+
+        rows, next_cursor = get_page(
+            "transactions", filters, ORDER, cursor, min(limit, MAX_PAGE_SIZE), since, until
+        )
+
+        return jsonify({
+            "transactions": [_transaction_json(t) for t in rows],
+            "nextCursor": next_cursor,
+        }), 200
 
     except Exception as e:
         import traceback
@@ -107,15 +177,7 @@ def get_transaction(transaction_id):
         result = get_records("transactions", {"transactionId": transaction_id})
         
         if result.data:
-            t = result.data[0]
-            return jsonify({
-                "transactionId": t.get("transactionId"),
-                "productIds": t.get("productIds"),
-                "total": t.get("total"),
-                "userId": t.get("userId"),
-                "inventoryId": t.get("inventoryId"),
-                "created_at": t.get("created_at"),
-            }), 200
+            return jsonify(_transaction_json(result.data[0])), 200
         else:
             return jsonify({"error": "Transaction not found"}), 404
 
@@ -123,3 +185,32 @@ def get_transaction(transaction_id):
         print(f"Error fetching transaction: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+
+# -------------------------
+# Backfill
+# -------------------------
+@transactions_bp.cli.command("backfill-line-items")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_line_items(batch_size):
+    """Convert legacy productIds rows to lineItems, one batch per round trip.
+
+    Unit prices come from the current product price, except single-product
+    transactions where total / quantity is exact.
+    """
+    cursor, converted = None, 0
+    while True:
+        rows, cursor = get_page("transactions", None, ORDER, cursor, batch_size, descending=False)
+        legacy = [t for t in rows if not t.get("lineItems") and t.get("productIds")]
+        if legacy:
+            prices = stored_prices({pid for t in legacy for pid in t["productIds"]})
+            for t in legacy:
+                t["lineItems"] = to_line_items(t["productIds"], prices)
+                if len(t["lineItems"]) == 1 and t.get("total"):
+                    t["lineItems"][0]["unitPrice"] = float(t["total"]) / t["lineItems"][0]["quantity"]
+                t["productIds"] = None
+            upsert_records("transactions", legacy, on_conflict="transactionId")
+            converted += len(legacy)
+            click.echo(f"converted {converted} transactions")
+        if not cursor:
+            break
+    click.echo(f"done: {converted} transactions converted")